@@ -0,0 +1,163 @@
+"""
+Compares the memory used by the results of 'ExploitFinder' against the
+previous implementation, and checks that both print the same output.
+
+Usage: python benchmarks/exploits.py [TARGETS]
+"""
+
+import hashlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+from nut.modules.exploits import ExploitFinder
+from nut.utils import HostSorter, iter_plugin_records
+
+
+class LegacyFinder:
+    """The result store before the compact representation."""
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _get_targets(plugin_outputs: list[dict]) -> list[str]:
+        hosts = HostSorter()
+
+        for record in iter_plugin_records(plugin_outputs):
+            hosts.add_parts(record.host, record.port)
+
+        return list(hosts)
+
+    def _add_data(self, plugin_id: int, plugin_name: str, scan_id: int, scan_name: str, exploits: dict, targets: list):
+        plugin = (plugin_id, plugin_name)
+        scan = (scan_id, scan_name)
+
+        if plugin not in self.data:
+            self.data[plugin] = {
+                "exploits": defaultdict(set),
+                "targets": defaultdict(list),
+            }
+
+        self.data[plugin]["exploits"].update(exploits)
+        self.data[plugin]["targets"][scan].extend(targets)
+
+    def print(self):
+        print("\n")
+
+        for plugin, data in self.data.items():
+            plugin_id, plugin_name = plugin
+
+            print(f"{plugin_name}")
+
+            for framework, exploits in data["exploits"].items():
+                exploits_str = ", ".join([e["name"] for e in exploits])
+                print(f"  {framework}: {exploits_str}")
+
+            print()
+
+            for scan, targets in data["targets"].items():
+                scan_id, scan_name = scan
+
+                print(f"  {scan_name} ({scan_id})")
+
+                for target in targets:
+                    print(f"    {target}")
+
+            print("\n")
+
+
+class _HashWriter(io.TextIOBase):
+    """Hashes everything written to it, so the output doesn't have to be kept."""
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, data: str) -> int:
+        self.hash.update(data.encode())
+        return len(data)
+
+
+def generate(count: int, scans: int = 10, plugins: int = 200) -> list[tuple]:
+    """Returns the plugins of every scan, like 'ExploitFinder._iter_plugins()'."""
+
+    rand = random.Random(0)
+    ports = [0, 21, 22, 80, 443, 445, 1433, 3389, 8080, 8443]
+
+    # Scans report the same hosts for many plugins
+    hosts = [
+        f"10.{rand.randrange(256)}.{rand.randrange(256)}.{rand.randrange(1, 255)}" for _ in range(count // 50 or 1)
+    ]
+    hosts += [f"host{i}.example.com" for i in range(len(hosts) // 10)]
+
+    exploits = {}
+    for plugin_id in range(plugins):
+        exploits[plugin_id] = {
+            "Metasploit": [
+                {"name": f"exploit/multi/example_{plugin_id}_{i}", "url": f"https://example.com/{plugin_id}/{i}"}
+                for i in range(rand.randrange(1, 4))
+            ],
+            "Core Impact": [],
+        }
+
+    per_plugin = count // (scans * plugins) or 1
+
+    result = []
+    for scan_id in range(scans):
+        for plugin_id in range(plugins):
+            ports_map = defaultdict(list)
+            for _ in range(per_plugin):
+                ports_map[f"{rand.choice(ports)} / tcp / www"].append({"hostname": rand.choice(hosts)})
+
+            outputs = [{"plugin_output": "", "ports": dict(ports_map)}]
+            result.append((plugin_id, f"Plugin {plugin_id}", scan_id, f"Scan {scan_id}", exploits[plugin_id], outputs))
+
+    return result
+
+
+def measure(finder, plugins: list[tuple]) -> tuple[float, int, str]:
+    """Fills the finder and returns the time, the peak memory, and the output hash."""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    for plugin_id, plugin_name, scan_id, scan_name, exploits, plugin_outputs in plugins:
+        targets = finder._get_targets(plugin_outputs)
+        finder._add_data(plugin_id, plugin_name, scan_id, scan_name, exploits, targets)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    writer = _HashWriter()
+    with redirect_stdout(writer):
+        finder.print()
+
+    return elapsed, peak, writer.hash.hexdigest()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    plugins = generate(count)
+
+    legacy_time, legacy_peak, legacy_hash = measure(LegacyFinder(), plugins)
+
+    # The finder is only used for its result store, it doesn't fetch anything
+    current_time, current_peak, current_hash = measure(ExploitFinder([], None), plugins)
+
+    assert current_hash == legacy_hash, "the output differs"
+
+    print(f"{count} targets in {len(plugins)} plugin results")
+    print(f"  legacy:  {legacy_peak / 2**20:7.1f} MiB peak, {legacy_time:.2f}s")
+    print(
+        f"  current: {current_peak / 2**20:7.1f} MiB peak, {current_time:.2f}s "
+        f"({legacy_peak / current_peak:.1f}x less)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares 'nut.utils.sort_hosts' against the previous implementation.
+
+Usage: python benchmarks/sort_hosts.py [COUNT]
+"""
+
+import random
+import sys
+import time
+from ipaddress import ip_address
+
+from nut.utils import sort_hosts, uniqify
+
+
+def legacy_sort_hosts(hostlist, unique=True):
+    """The implementation before the packed sort keys."""
+
+    def _sort(target):
+        host, _, port = target.partition(":")
+
+        if port:
+            port, _, proto = port.partition("/")
+            port = int(port)
+        else:
+            port, proto = 0, ""
+
+        try:
+            ip = ip_address(host)
+            return 0, int(ip), port, proto
+        except ValueError:
+            return 2, host, port, proto
+
+    result = sorted(hostlist, key=_sort)
+    if unique:
+        result = uniqify(result)
+
+    return result
+
+
+def generate(count: int) -> list[str]:
+    rand = random.Random(0)
+    ports = [0, 22, 80, 443, 445, 3389, 8080, 8443]
+
+    # Scans report several ports per host, so hosts repeat
+    hosts = []
+    for _ in range(count // 4 or 1):
+        kind = rand.random()
+
+        # The legacy implementation can't parse IPv6 addresses with ports
+        if kind < 0.8:
+            hosts.append(f"10.{rand.randrange(256)}.{rand.randrange(256)}.{rand.randrange(1, 255)}")
+        else:
+            hosts.append(f"host{rand.randrange(count)}.example.com")
+
+    targets = []
+    for _ in range(count):
+        host = rand.choice(hosts)
+        port = rand.choice(ports)
+        targets.append(f"{host}:{port}/tcp" if port else host)
+
+    return targets
+
+
+def measure(func, targets) -> float:
+    start = time.perf_counter()
+    func(targets)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    targets = generate(count)
+
+    assert sort_hosts(targets) == legacy_sort_hosts(targets)
+
+    legacy = measure(legacy_sort_hosts, targets)
+    current = measure(sort_hosts, targets)
+
+    print(f"{count} targets ({len(set(targets))} unique)")
+    print(f"  legacy:  {legacy:.2f}s")
+    print(f"  current: {current:.2f}s ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
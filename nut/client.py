@@ -0,0 +1,239 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from nessus import NessusAPI
+from nessus.api import locked
+from nessus.exceptions import NessusException
+from nessus.models import ScanFilters
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, Timeout
+
+from nut.limiter import MAX_CONCURRENCY, OVERLOAD_RETRIES, RETRY_DELAY, AdaptiveLimiter, endpoint_class
+from nut.progress import count_response
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a connection and for every read of a response
+DEFAULT_TIMEOUT = 60
+
+
+def _invalidates_cache(method):
+    """Clears the cache after requests that change scans or folders."""
+
+    @wraps(method)
+    def wrapper(instance, *args, **kwargs):
+        result = method(instance, *args, **kwargs)
+        instance.clear_cache()
+        return result
+
+    return wrapper
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter with a default timeout, the NessusAPI doesn't set one."""
+
+    def __init__(self, timeout: float, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+class CachingNessusAPI(NessusAPI):
+    """
+    NessusAPI that can cache the responses of read-only requests.
+
+    The cache is disabled by default. Once it's enabled, every scan listing,
+    scan detail, host detail, and plugin detail is only fetched once, no
+    matter how many modules ask for it. Long-lived processes should set a
+    TTL, so scans that changed on the server are eventually fetched again.
+
+    Every request waits for a slot of the client's limiter, which adapts the
+    number of concurrent requests to how well the server keeps up. Requests
+    time out, so a hung server doesn't block the slots forever.
+    """
+
+    def __init__(self, *args, timeout: float = DEFAULT_TIMEOUT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = None
+        self._cache_ttl = None
+        self._pool_size = None
+        self.timeout = timeout
+
+        # Count the requests and bytes for the progress of the running module
+        self._session.hooks["response"].append(count_response)
+
+        self.limiter = AdaptiveLimiter(self.base_url)
+        self._session.hooks["response"].append(self.limiter.response_hook)
+        self.set_pool_size(MAX_CONCURRENCY)
+
+    def _request(self, method: str, path: str, *args, **kwargs):
+        endpoint = endpoint_class(method, path)
+
+        # Downloads take as long as they're big, their latency says little
+        timed = not kwargs.get("download")
+
+        for attempt in range(OVERLOAD_RETRIES + 1):
+            try:
+                with self.limiter.slot(endpoint, timed):
+                    return super()._request(method, path, *args, **kwargs)
+
+            except (NessusException, RequestException) as e:
+                # Only reads are safe to send again, the limit is lower by now
+                if method != "GET" or attempt == OVERLOAD_RETRIES or not self.limiter.overloaded():
+                    # Like connection errors, timeouts are reported as errors from Nessus
+                    if isinstance(e, Timeout):
+                        raise NessusException(f"Nessus didn't respond within {self.timeout}s") from e
+                    raise
+
+            delay = RETRY_DELAY * 2**attempt
+            logger.debug(f"Server is overloaded, retrying in {delay}s")
+            time.sleep(delay)
+
+    @property
+    def cache_enabled(self) -> bool:
+        return self._cache is not None
+
+    @property
+    def cache_ttl(self) -> Optional[float]:
+        return self._cache_ttl
+
+    def set_pool_size(self, size: int):
+        """Sets how many connections are kept open for concurrent requests."""
+
+        # Mounting a new adapter closes the open connections
+        if size == self._pool_size:
+            return
+        self._pool_size = size
+
+        adapter = _TimeoutAdapter(self.timeout, pool_connections=1, pool_maxsize=size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def set_concurrency(self, workers: Optional[int] = None):
+        """Fixes the number of concurrent requests, or lets it adapt to the server if None."""
+
+        self.limiter.configure(workers)
+        self.set_pool_size(max(workers or 0, MAX_CONCURRENCY))
+
+    def enable_cache(self, ttl: Optional[float] = None):
+        if self._cache is None:
+            logger.debug("Enabling the response cache")
+            self._cache = {}
+
+        self._cache_ttl = ttl
+
+    def clear_cache(self):
+        if self._cache:
+            logger.debug("Clearing the response cache")
+            self._cache.clear()
+
+    def _cached(self, key: tuple, fetch, *args, **kwargs):
+        """Returns the cached response for the key, or fetches and caches it."""
+
+        if self._cache is None:
+            return fetch(*args, **kwargs)
+
+        now = time.monotonic()
+
+        # Entries are stored with the time they were fetched at
+        entry = self._cache.get(key)
+        if entry is not None:
+            fetched_at, response = entry
+            if self._cache_ttl is None or now - fetched_at < self._cache_ttl:
+                return response
+
+        response = fetch(*args, **kwargs)
+        self._cache[key] = (now, response)
+
+        return response
+
+    # --- Cached Requests ---
+
+    def scans_list(self, folder_id: Optional[int] = None, last_modification_date: Optional[int] = None) -> dict:
+        key = ("scans_list", folder_id, last_modification_date)
+        return self._cached(key, super().scans_list, folder_id, last_modification_date)
+
+    def scans_details(
+        self,
+        scan_id: int,
+        history_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        filters: Optional[ScanFilters] = None,
+    ) -> dict:
+        _filters = filters.model_dump_json() if filters is not None else None
+        key = ("scans_details", scan_id, history_id, limit, _filters)
+        return self._cached(key, super().scans_details, scan_id, history_id, limit, filters)
+
+    def scans_host_details(self, scan_id: int, host_id: int, history_id: Optional[int] = None) -> dict:
+        key = ("scans_host_details", scan_id, host_id, history_id)
+        return self._cached(key, super().scans_host_details, scan_id, host_id, history_id)
+
+    def scans_plugin_details(self, scan_id: int, plugin_id: int, history_id: Optional[int] = None) -> dict:
+        key = ("scans_plugin_details", scan_id, plugin_id, history_id)
+        return self._cached(key, super().scans_plugin_details, scan_id, plugin_id, history_id)
+
+    # --- Invalidating Requests ---
+
+    folders_create = _invalidates_cache(NessusAPI.folders_create)
+    folders_edit = _invalidates_cache(NessusAPI.folders_edit)
+    folders_delete = _invalidates_cache(NessusAPI.folders_delete)
+
+    scans_create = _invalidates_cache(NessusAPI.scans_create)
+    scans_copy = _invalidates_cache(NessusAPI.scans_copy)
+    scans_delete = _invalidates_cache(NessusAPI.scans_delete)
+    scans_delete_bulk = _invalidates_cache(NessusAPI.scans_delete_bulk)
+    scans_import = _invalidates_cache(NessusAPI.scans_import)
+
+    # --- Additional Requests ---
+
+    def editor_scan_details(self, scan_id: int) -> dict:
+        """Returns the editor form of the scan, which contains its current settings."""
+        return self._get(f"editor/scan/{scan_id}")
+
+    @_invalidates_cache
+    @locked
+    def scans_configure(self, scan_id: int, template_uuid: str, settings: dict) -> dict:
+        """
+        Changes the settings of an existing scan. Unlike 'scans_create()', the
+        settings are a dict, so they can include the current values of settings
+        that ScanCreateSettings doesn't know (e.g. the schedule).
+        """
+        return self._put(f"scans/{scan_id}", data={"uuid": template_uuid, "settings": settings})
+
+
+class ClientProxy:
+    """
+    Forwards everything to the active client.
+
+    Modules import the central 'nessus' instance once, so switching the data
+    source (e.g. to the local database of 'nut sync') has to happen behind it.
+    Threads that work with different servers at the same time select their
+    client with 'using()', which only affects the current context.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._context_client = ContextVar("context_client", default=None)
+
+    def use(self, client):
+        """Makes the client the active one."""
+        self._client = client
+
+    @contextmanager
+    def using(self, client):
+        """Makes the client the active one in the current context."""
+
+        token = self._context_client.set(client)
+        try:
+            yield client
+        finally:
+            self._context_client.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self._context_client.get() or self._client, name)
@@ -0,0 +1,183 @@
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Optional
+
+from nut.settings import SOCKET_FILE, args
+
+logger = logging.getLogger(__name__)
+
+
+def forward(argv: list[str]) -> Optional[int]:
+    """
+    Runs the command on a running 'nut serve' and returns its exit code, or
+    None if no server is running.
+
+    The arguments and working directory are sent as a single JSON line. The
+    server streams stdout and stderr back as JSON lines, followed by a final
+    line with the exit code.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(str(SOCKET_FILE))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+
+    streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+
+    with sock, sock.makefile("rwb") as conn:
+        request = {"argv": argv, "cwd": os.getcwd()}
+        conn.write(json.dumps(request).encode() + b"\n")
+        conn.flush()
+
+        for line in conn:
+            message = json.loads(line)
+
+            if "exit" in message:
+                return message["exit"]
+
+            stream = streams[message["stream"]]
+            stream.write(message["data"])
+            stream.flush()
+
+    # The server went away without sending an exit code
+    return 1
+
+
+class _ClientStream(io.TextIOBase):
+    """Text stream that sends everything written to it to the client."""
+
+    def __init__(self, conn, name: str):
+        self.conn = conn
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, data: str) -> int:
+        message = {"stream": self.name, "data": data}
+        self.conn.write(json.dumps(message).encode() + b"\n")
+        self.conn.flush()
+        return len(data)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from nessus.exceptions import NessusException
+
+        from nut.main import execute, log_handler, parse_args
+
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        request = json.loads(line)
+
+        stdout = _ClientStream(self.wfile, "stdout")
+        stderr = _ClientStream(self.wfile, "stderr")
+
+        # Log messages of the command go to the client
+        handler = log_handler(stderr)
+        level = logging.root.level
+
+        exit_code = 0
+        cwd = os.getcwd()
+
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                # Relative paths in the arguments are checked while parsing them
+                os.chdir(request["cwd"])
+
+                # 'args' is shared by all modules, so it has to be reset
+                args.__dict__.clear()
+                parse_args(request["argv"])
+
+                logger.info(f"Running 'nut {' '.join(request['argv'])}'")
+
+                logging.root.addHandler(handler)
+                logging.root.setLevel(min(level, args.loglevel))
+                handler.setLevel(args.loglevel)
+
+                execute()
+
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+
+            except NessusException as e:
+                logger.error(f"Error from Nessus: {e}")
+                exit_code = 1
+
+            # The server has to survive errors in a single command
+            except Exception:
+                logger.exception("Command failed")
+                exit_code = 1
+
+            finally:
+                logging.root.removeHandler(handler)
+                logging.root.setLevel(level)
+                os.chdir(cwd)
+
+        try:
+            self.wfile.write(json.dumps({"exit": exit_code}).encode() + b"\n")
+        except OSError:
+            logger.debug("Client disconnected before the command finished")
+
+
+def _is_listening() -> bool:
+    """Checks if a server is listening on the socket."""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(SOCKET_FILE))
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+
+    return True
+
+
+def serve(ttl: float):
+    """Runs the server until it's interrupted."""
+
+    from nut.utils import nessus
+
+    # Remove the socket of a server that didn't shut down cleanly
+    if SOCKET_FILE.exists():
+        if _is_listening():
+            logger.error(f"Another server is already listening on '{SOCKET_FILE}'")
+            return
+        SOCKET_FILE.unlink()
+
+    nessus.enable_cache(ttl)
+
+    # The server runs commands with the stored credentials, so only the
+    # current user may connect to it. Commands share the global 'args' and
+    # the working directory, so they're handled one at a time, which is what
+    # 'UnixStreamServer' does.
+    old_umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(str(SOCKET_FILE), _RequestHandler)
+    finally:
+        os.umask(old_umask)
+
+    # Shut down cleanly (and remove the socket) when terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    logger.info(f"Listening on '{SOCKET_FILE}', caching responses for {ttl:g}s")
+
+    try:
+        with server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        SOCKET_FILE.unlink(missing_ok=True)
+
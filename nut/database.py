@@ -0,0 +1,369 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+from nessus.models import ScanFilters
+
+from nut.settings import DATABASE_FILE
+from nut.utils import iter_port_records
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    folder_id INTEGER,
+    folder_name TEXT,
+    status TEXT,
+    last_modification_date INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS hosts (
+    scan_id INTEGER NOT NULL,
+    host_id INTEGER NOT NULL,
+    hostname TEXT NOT NULL,
+    critical INTEGER,
+    high INTEGER,
+    medium INTEGER,
+    low INTEGER,
+    info INTEGER,
+    PRIMARY KEY (scan_id, host_id)
+);
+
+CREATE TABLE IF NOT EXISTS plugins (
+    scan_id INTEGER NOT NULL,
+    plugin_id INTEGER NOT NULL,
+    name TEXT,
+    family TEXT,
+    severity INTEGER,
+    count INTEGER,
+    exploit_available INTEGER,
+    vuln_information TEXT,
+    PRIMARY KEY (scan_id, plugin_id)
+);
+
+CREATE TABLE IF NOT EXISTS outputs (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL,
+    plugin_id INTEGER NOT NULL,
+    plugin_output TEXT
+);
+
+CREATE TABLE IF NOT EXISTS ports (
+    output_id INTEGER NOT NULL,
+    scan_id INTEGER NOT NULL,
+    plugin_id INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    proto TEXT,
+    service TEXT
+);
+
+CREATE INDEX IF NOT EXISTS plugins_plugin_id ON plugins (plugin_id);
+CREATE INDEX IF NOT EXISTS plugins_severity ON plugins (severity);
+CREATE INDEX IF NOT EXISTS outputs_scan_plugin ON outputs (scan_id, plugin_id);
+CREATE INDEX IF NOT EXISTS ports_scan_plugin ON ports (scan_id, plugin_id);
+CREATE INDEX IF NOT EXISTS ports_plugin_id ON ports (plugin_id);
+CREATE INDEX IF NOT EXISTS ports_host ON ports (host);
+CREATE INDEX IF NOT EXISTS ports_port ON ports (port);
+"""
+
+# Tables with rows that belong to a scan, and the column holding its id
+_SCAN_TABLES = {"ports": "scan_id", "outputs": "scan_id", "plugins": "scan_id", "hosts": "scan_id", "scans": "id"}
+
+
+def connect(path: Path, readonly: bool = False) -> sqlite3.Connection:
+    """Opens the database and creates the tables if needed."""
+
+    if readonly:
+        if not path.exists():
+            raise FileNotFoundError(f"Database '{path}' doesn't exist, run 'nut sync' first")
+
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.executescript(SCHEMA)
+
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_modification_date(conn: sqlite3.Connection, scan_id: int) -> Optional[int]:
+    """Returns the modification date of the scan when it was last synced."""
+
+    row = conn.execute("SELECT last_modification_date FROM scans WHERE id = ?", (scan_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _is_true(value) -> bool:
+    """Nessus returns booleans in plugin attributes as strings."""
+    return value is True or value == "true"
+
+
+def replace_scan(conn: sqlite3.Connection, scan: dict, folder_name: str, details: dict, plugins: list[tuple]):
+    """
+    Replaces everything stored about the scan in a single transaction.
+
+    The plugins are (vulnerability, plugin details) tuples, with the
+    vulnerability from the scan details.
+    """
+
+    scan_id = scan["id"]
+
+    with conn:
+        for table, column in _SCAN_TABLES.items():
+            conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (scan_id,))
+
+        conn.execute(
+            "INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?)",
+            (scan_id, scan["name"], scan["folder_id"], folder_name, scan["status"], scan["last_modification_date"]),
+        )
+
+        conn.executemany(
+            "INSERT INTO hosts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (scan_id, h["host_id"], h["hostname"], h["critical"], h["high"], h["medium"], h["low"], h["info"])
+                for h in details.get("hosts") or []
+            ),
+        )
+
+        for vulnerability, plugin_details in plugins:
+            plugin_id = vulnerability["plugin_id"]
+
+            attributes = plugin_details["info"]["plugindescription"]["pluginattributes"]
+            vuln_info = attributes.get("vuln_information") or {}
+
+            conn.execute(
+                "INSERT INTO plugins VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    scan_id,
+                    plugin_id,
+                    vulnerability["plugin_name"],
+                    vulnerability.get("plugin_family"),
+                    vulnerability["severity"],
+                    vulnerability.get("count"),
+                    _is_true(vuln_info.get("exploit_available")),
+                    json.dumps(vuln_info),
+                ),
+            )
+
+            for output in plugin_details.get("outputs") or []:
+                cursor = conn.execute(
+                    "INSERT INTO outputs (scan_id, plugin_id, plugin_output) VALUES (?, ?, ?)",
+                    (scan_id, plugin_id, output["plugin_output"]),
+                )
+
+                conn.executemany(
+                    "INSERT INTO ports VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (cursor.lastrowid, scan_id, plugin_id, record.host, record.port, record.proto, record.service)
+                        for record in iter_port_records(output["ports"])
+                    ),
+                )
+
+
+def _filter_value(item_filter: str, row: sqlite3.Row, vuln_info: dict):
+    """Returns the value of the plugin that the Nessus filter looks at."""
+
+    if item_filter in ("severity", "plugin_id"):
+        return row[item_filter]
+
+    if item_filter == "plugin_name":
+        return row["name"]
+
+    value = vuln_info.get(item_filter)
+    if value in ("true", "false"):
+        return value == "true"
+
+    return value
+
+
+def _matches(filters: ScanFilters, row: sqlite3.Row) -> bool:
+    """Evaluates the Nessus scan filters against a stored plugin."""
+
+    vuln_info = json.loads(row["vuln_information"])
+
+    results = []
+    for item in filters.filters:
+        value = _filter_value(item.filter, row, vuln_info)
+
+        if item.quality == "eq":
+            results.append(value == item.value)
+        elif item.quality == "neq":
+            results.append(value != item.value)
+        elif item.quality == "gt":
+            results.append(value is not None and value > item.value)
+        elif item.quality == "lt":
+            results.append(value is not None and value < item.value)
+        elif item.quality == "match":
+            results.append(str(item.value) in str(value))
+        elif item.quality == "nmatch":
+            results.append(str(item.value) not in str(value))
+        else:
+            raise ValueError(f"Unsupported filter quality '{item.quality}'")
+
+    return all(results) if filters.search_type == "and" else any(results)
+
+
+class LocalNessus:
+    """
+    Serves scans from the database created by 'nut sync'.
+
+    Implements the subset of the NessusAPI that the modules use and returns
+    responses in the same shape, so the modules work without any changes
+    and without touching the scanner.
+    """
+
+    def __init__(self, path: Path = DATABASE_FILE):
+        logger.info(f"Using the local database '{path}'")
+
+        self.conn = connect(path, readonly=True)
+
+        # The connection is shared by the worker threads of some modules
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # The database is already local and read-only, there's nothing to tune
+
+    def enable_cache(self, ttl: Optional[float] = None):
+        pass
+
+    def clear_cache(self):
+        pass
+
+    def set_pool_size(self, size: int):
+        pass
+
+    # --- Scans ---
+
+    def scans_list(self, folder_id: Optional[int] = None, last_modification_date: Optional[int] = None) -> dict:
+        sql = "SELECT * FROM scans WHERE (? IS NULL OR folder_id = ?) AND (? IS NULL OR last_modification_date >= ?)"
+        rows = self._query(sql, (folder_id, folder_id, last_modification_date, last_modification_date))
+
+        scans = [
+            {
+                "id": row["id"],
+                "name": row["name"],
+                "folder_id": row["folder_id"],
+                "status": row["status"],
+                "last_modification_date": row["last_modification_date"],
+            }
+            for row in rows
+        ]
+
+        folders = self._query("SELECT DISTINCT folder_id, folder_name FROM scans")
+
+        return {
+            "folders": [{"id": row["folder_id"], "name": row["folder_name"]} for row in folders],
+            "scans": scans,
+        }
+
+    def get_scans(self) -> list[dict]:
+        return self.scans_list()["scans"]
+
+    def get_folders(self) -> list[dict]:
+        return self.scans_list()["folders"]
+
+    def get_folder_id(self, folder_name: str) -> Optional[int]:
+        for folder in self.get_folders():
+            if folder["name"] == folder_name:
+                return folder["id"]
+        return None
+
+    def scans_details(self, scan_id: int, filters: Optional[ScanFilters] = None, **_) -> dict:
+        scan = self._query("SELECT * FROM scans WHERE id = ?", (scan_id,))
+        if not scan:
+            return {}
+
+        hosts = self._query("SELECT * FROM hosts WHERE scan_id = ?", (scan_id,))
+        plugins = self._query("SELECT * FROM plugins WHERE scan_id = ? ORDER BY severity DESC", (scan_id,))
+
+        if filters is not None:
+            plugins = [row for row in plugins if _matches(filters, row)]
+
+        return {
+            "info": {"name": scan[0]["name"], "folder_id": scan[0]["folder_id"], "status": scan[0]["status"]},
+            "hosts": [{key: row[key] for key in row.keys() if key != "scan_id"} for row in hosts],
+            "vulnerabilities": [
+                {
+                    "plugin_id": row["plugin_id"],
+                    "plugin_name": row["name"],
+                    "plugin_family": row["family"],
+                    "severity": row["severity"],
+                    "count": row["count"],
+                }
+                for row in plugins
+            ],
+        }
+
+    def get_scan_details(self, scan_id: int, filters: Optional[ScanFilters] = None) -> dict:
+        return self.scans_details(scan_id, filters=filters)
+
+    # --- Hosts ---
+
+    def scans_host_details(self, scan_id: int, host_id: int, history_id: Optional[int] = None) -> dict:
+        host = self._query("SELECT * FROM hosts WHERE scan_id = ? AND host_id = ?", (scan_id, host_id))
+        if not host:
+            return {}
+
+        hostname = host[0]["hostname"]
+
+        # Like Nessus, the count is how often the plugin was reported for the host
+        plugins = self._query(
+            "SELECT p.*, c.count FROM plugins p JOIN "
+            "(SELECT plugin_id, COUNT(*) AS count FROM ports WHERE scan_id = ? AND host = ? GROUP BY plugin_id) c "
+            "ON p.plugin_id = c.plugin_id WHERE p.scan_id = ? ORDER BY p.severity DESC",
+            (scan_id, hostname, scan_id),
+        )
+
+        return {
+            "info": {"host-ip": hostname},
+            "vulnerabilities": [
+                {
+                    "host_id": host_id,
+                    "hostname": hostname,
+                    "plugin_id": row["plugin_id"],
+                    "plugin_name": row["name"],
+                    "plugin_family": row["family"],
+                    "severity": row["severity"],
+                    "count": row["count"],
+                }
+                for row in plugins
+            ],
+        }
+
+    # --- Plugins ---
+
+    def scans_plugin_details(self, scan_id: int, plugin_id: int, history_id: Optional[int] = None) -> dict:
+        plugin = self._query("SELECT * FROM plugins WHERE scan_id = ? AND plugin_id = ?", (scan_id, plugin_id))
+        if not plugin:
+            return {}
+
+        outputs = self._query("SELECT * FROM outputs WHERE scan_id = ? AND plugin_id = ?", (scan_id, plugin_id))
+        ports = self._query("SELECT * FROM ports WHERE scan_id = ? AND plugin_id = ?", (scan_id, plugin_id))
+
+        # Group the hosts by output and port the way Nessus does
+        output_ports = defaultdict(lambda: defaultdict(list))
+        for row in ports:
+            key = f"{row['port']} / {row['proto']} / {row['service']}"
+            output_ports[row["output_id"]][key].append({"hostname": row["host"]})
+
+        vuln_info = json.loads(plugin[0]["vuln_information"])
+
+        return {
+            "info": {"plugindescription": {"pluginattributes": {"vuln_information": vuln_info}}},
+            "outputs": [
+                {"plugin_output": row["plugin_output"], "ports": dict(output_ports[row["id"]])} for row in outputs
+            ],
+        }
+
+    def get_plugin_details(self, scan_id: int, plugin_id: int) -> dict:
+        return self.scans_plugin_details(scan_id, plugin_id)
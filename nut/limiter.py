@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from requests.exceptions import ConnectionError, Timeout
+
+logger = logging.getLogger(__name__)
+
+# Bounds of the concurrent requests to a server. The limit starts low and
+# grows while the server keeps up.
+MIN_CONCURRENCY = 1
+START_CONCURRENCY = 4
+MAX_CONCURRENCY = 32
+
+# Status codes of an overloaded server
+OVERLOAD_STATUS = {429, 502, 503, 504}
+
+# GET requests that overloaded the server are retried after 1, 2, 4 seconds
+OVERLOAD_RETRIES = 3
+RETRY_DELAY = 1
+
+# The average latency is a spike when it exceeds the baseline by this factor
+LATENCY_FACTOR = 2.0
+
+# Weight of a new latency in the moving average
+LATENCY_WEIGHT = 0.2
+
+# How fast the baseline follows a latency that's higher for good, e.g. because
+# the later responses are bigger
+BASELINE_DRIFT = 0.01
+
+
+def endpoint_class(method: str, path: str) -> str:
+    """Returns the class of the endpoint, with ids and tokens replaced, e.g. 'GET scans/*/plugins/*'."""
+
+    segments = ("*" if any(c.isdigit() for c in segment) else segment for segment in path.strip("/").split("/"))
+    return f"{method} {'/'.join(segments)}"
+
+
+class AdaptiveLimiter:
+    """
+    Limits the concurrent requests to a server and adapts the limit to it.
+
+    The limit grows by one after every round of healthy requests (as many as
+    the limit) that actually used it. Timeouts, connection errors, overload
+    responses, and latency spikes halve it. Requests that were sent before
+    a decrease don't count, so one overload only halves the limit once.
+    A latency spike is a moving average that's far above the baseline,
+    which is the lowest average so far. Both are kept per endpoint class
+    (e.g. 'GET scans/*/plugins/*'), since the endpoints differ a lot in how
+    long they take. Downloads take as long as they're big, so they're
+    left out.
+
+    A fixed limit turns the adaption off.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+
+        self.limit = START_CONCURRENCY
+        self.min_limit = MIN_CONCURRENCY
+        self.max_limit = MAX_CONCURRENCY
+        self.fixed = False
+
+        self.in_flight = 0
+
+        # Statistics for the debug output
+        self.peak = self.limit
+        self.requests = 0
+        self.failures = 0
+
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+        # Healthy requests since the last change, and whether the limit was reached
+        self._healthy = 0
+        self._saturated = False
+
+        # Incremented on every decrease, each request remembers the epoch it was sent in
+        self._epoch = 0
+
+        # Maps endpoint classes to their moving average and baseline latency
+        self._latencies = {}
+
+    def configure(self, limit: Optional[int] = None):
+        """
+        Fixes the limit, or lets it adapt again if no limit is given. An
+        adapting limit keeps what it learned, e.g. between commands of 'nut serve'.
+        """
+
+        with self._condition:
+            if limit is not None:
+                self.limit = self.min_limit = self.max_limit = limit
+                self.fixed = True
+
+            elif self.fixed:
+                self.limit = START_CONCURRENCY
+                self.min_limit = MIN_CONCURRENCY
+                self.max_limit = MAX_CONCURRENCY
+                self.fixed = False
+
+            self._condition.notify_all()
+
+    def overloaded(self) -> bool:
+        """Returns whether the last request of the current thread overloaded the server."""
+        return getattr(self._local, "overloaded", False)
+
+    def response_hook(self, response, *_, **__):
+        """Response hook for the session of the client, remembers the status code."""
+        self._local.status = response.status_code
+
+    @contextmanager
+    def slot(self, endpoint: str = "", timed: bool = True) -> Iterator[None]:
+        """
+        Waits until a request to the endpoint class may be sent, and learns
+        from how it went. The latency of requests that aren't 'timed' isn't
+        checked for spikes.
+        """
+
+        # Requests made while sending a request (e.g. to authenticate) use its slot
+        if getattr(self._local, "active", False):
+            yield
+            return
+
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+
+            epoch = self._epoch
+
+        self._local.active = True
+        self._local.status = None
+
+        started_at = time.monotonic()
+        overloaded = False
+        try:
+            yield
+
+        except Exception as e:
+            # The client raises its own exception for connection errors
+            cause = e.__cause__ or e
+            overloaded = isinstance(cause, (ConnectionError, Timeout))
+            raise
+
+        finally:
+            self._local.active = False
+            overloaded = self._local.overloaded = overloaded or self._local.status in OVERLOAD_STATUS
+            latency = time.monotonic() - started_at if timed else None
+            self._release(endpoint, latency, overloaded, epoch)
+
+    def _observe(self, endpoint: str, latency: float) -> list[float]:
+        """Adds the latency to the average and baseline of the endpoint class, and returns both."""
+
+        latencies = self._latencies.get(endpoint)
+        if latencies is None:
+            latencies = self._latencies[endpoint] = [latency, latency]
+            return latencies
+
+        average, baseline = latencies
+        average += (latency - average) * LATENCY_WEIGHT
+
+        if average < baseline:
+            baseline = average
+        else:
+            baseline += (average - baseline) * BASELINE_DRIFT
+
+        latencies[:] = average, baseline
+        return latencies
+
+    def _release(self, endpoint: str, latency: Optional[float], overloaded: bool, epoch: int):
+        with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            self._condition.notify()
+
+            if overloaded:
+                self.failures += 1
+
+            # Requests of an earlier epoch were sent at a higher limit
+            if epoch != self._epoch:
+                return
+
+            if overloaded:
+                self._decrease("overloaded")
+                return
+
+            if latency is not None:
+                average, baseline = self._observe(endpoint, latency)
+                if average > baseline * LATENCY_FACTOR:
+                    self._decrease(f"{endpoint} latency {average:.2f}s, baseline {baseline:.2f}s")
+                    return
+
+            self._healthy += 1
+            if self._healthy >= self.limit and self._saturated:
+                self._increase()
+
+    def _increase(self):
+        self._healthy = 0
+        self._saturated = False
+
+        if self.limit >= self.max_limit:
+            return
+
+        self.limit += 1
+        self.peak = max(self.peak, self.limit)
+        self._condition.notify_all()
+
+        logger.debug(f"Concurrency limit of '{self.name}' raised to {self.limit}")
+
+    def _decrease(self, reason: str):
+        self._healthy = 0
+        self._saturated = False
+        self._epoch += 1
+
+        # The latencies are expected to recover at the lower limit
+        for latencies in self._latencies.values():
+            latencies[0] = latencies[1]
+
+        if self.limit <= self.min_limit:
+            return
+
+        self.limit = max(self.limit // 2, self.min_limit)
+
+        logger.debug(f"Concurrency limit of '{self.name}' lowered to {self.limit} ({reason})")
+
+    def summary(self) -> str:
+        with self._condition:
+            mode = "fixed" if self.fixed else f"adaptive, peak {self.peak}"
+            summary = f"limit {self.limit} ({mode}), {self.requests} requests, {self.failures} overloaded"
+
+            baselines = ", ".join(f"{endpoint} {latencies[1]:.2f}s" for endpoint, latencies in self._latencies.items())
+            if baselines:
+                summary += f", baseline latencies: {baselines}"
+
+            return summary
@@ -1,16 +1,24 @@
 import argparse
 import logging
+import sys
 from argparse import ArgumentTypeError
+from datetime import datetime
 from pathlib import Path
+from typing import IO, Optional
 
 from colorama import Fore, Style
-from nessus.exceptions import NessusException
 
-from nut.settings import args
-from nut.utils import resolve_scan_ids
+from nut.daemon import forward
+from nut.settings import DATABASE_FILE, DEFAULT_SERVER, SEVERITIES, args, config, get_server_sections
 
 logger = logging.getLogger(__name__)
 
+# Modules that can be combined with 'nut run', in the order they're run
+PIPELINE_MODULES = ["urls", "exploits", "export"]
+
+# Modules that report their progress, with the units they track
+PROGRESS_UNITS = {"exploits": ("scans", "plugins"), "export": ("scans",), "urls": ("scans",)}
+
 
 class CustomFormatter(logging.Formatter):
     """Custom formatter that colors the level name."""
@@ -28,22 +36,31 @@ class CustomFormatter(logging.Formatter):
         # Get the color for the log level
         color = self.level_color[record.levelno]
 
+        # Work on a copy, the record is shared with the other handlers
+        record = logging.makeLogRecord(record.__dict__)
+
         # Overwrite 'levelname' with a colored version
         record.levelname = f"{color}{record.levelname}{Style.RESET_ALL}"
 
         return super().format(record)
 
 
-def setup_logging(level: int):
-    """Configure the logging."""
+def log_handler(stream: Optional[IO] = None) -> logging.Handler:
+    """Returns a handler that writes colored log messages to the stream."""
 
     # Custom formatter and message format
     formatter = CustomFormatter("[%(levelname)s] %(message)s")
 
-    handler = logging.StreamHandler()
+    handler = logging.StreamHandler(stream)
     handler.setFormatter(formatter)
 
-    logging.root.addHandler(handler)
+    return handler
+
+
+def setup_logging(level: int):
+    """Configure the logging."""
+
+    logging.root.addHandler(log_handler())
     logging.root.setLevel(level)
 
     # Overwrite the default log level names
@@ -66,7 +83,29 @@ def path_file(string):
     return path
 
 
-def parse_args():
+def date_timestamp(string):
+    """Returns the date (YYYY-MM-DD or ISO 8601) as a unix timestamp."""
+
+    try:
+        return int(datetime.fromisoformat(string).timestamp())
+    except ValueError:
+        raise ArgumentTypeError(f"{string} is not a valid date (YYYY-MM-DD)")
+
+
+def _format_parser(*formats):
+    """Returns a parent parser with an output format argument."""
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--format",
+        choices=formats,
+        default=formats[0],
+        help="Output format, jsonl and csv are streamed as results come in",
+    )
+    return parser
+
+
+def parse_args(argv: Optional[list[str]] = None):
     """Parse command line arguments."""
 
     # --- Common Arguments ---
@@ -74,15 +113,59 @@ def parse_args():
     # common arguments that all parsers share
     _common = argparse.ArgumentParser(add_help=False)
     _common.add_argument("-v", dest="loglevel", action="store_const", const=logging.DEBUG, default=logging.INFO)
+    _common.add_argument("--direct", action="store_true", help="Don't forward the command to a running 'nut serve'")
     _common.set_defaults(uses_scans=False)
 
     # arguments for modules that work with scans
     _scans = argparse.ArgumentParser(add_help=False)
-    _scans.add_argument("-s", "--scans", metavar="SCAN", nargs="*", default=[], type=str, help="Scan ID or name")
-    _scans.add_argument("-f", "--folders", metavar="FOLDER", nargs="*", default=[], type=str, help="Folder ID or name")
+    _scans.add_argument(
+        "-s", "--scans", metavar="SCAN", nargs="*", default=[], type=str, help="Scan ID, name, glob, or re:regex"
+    )
+    _scans.add_argument(
+        "-f", "--folders", metavar="FOLDER", nargs="*", default=[], type=str, help="Folder ID, name, glob, or re:regex"
+    )
+    _scans.add_argument("--status", nargs="+", help="Only scans with one of these statuses")
+    _scans.add_argument("--since", metavar="DATE", type=date_timestamp, help="Only scans modified since")
     _scans.set_defaults(uses_scans=True)  # indicates that the module uses scans
     _scans.set_defaults(scan_ids=[])
 
+    # arguments for modules that can write machine-readable output
+    _format = _format_parser("table", "jsonl", "csv")
+
+    # arguments for modules that can run on several servers at once
+    _servers = argparse.ArgumentParser(add_help=False)
+    _servers.add_argument(
+        "--servers",
+        metavar="SERVER",
+        nargs="+",
+        help="Servers from the config to run on concurrently ('default' for [nessus], 'all' for every server)",
+    )
+
+    # arguments for long-running modules
+    _progress = argparse.ArgumentParser(add_help=False)
+    _progress.add_argument(
+        "--no-progress",
+        dest="progress",
+        action="store_false",
+        help="Don't report the progress (a status line on a terminal, periodic log messages otherwise)",
+    )
+
+    # arguments for modules that send many requests
+    _workers = argparse.ArgumentParser(add_help=False)
+    _workers.add_argument(
+        "--workers",
+        type=int,
+        help="Fixed number of concurrent requests per server (default: adapts to the server's latency)",
+    )
+
+    # arguments for modules that work with the local database
+    _db = argparse.ArgumentParser(add_help=False)
+    _db.add_argument("--db", type=Path, default=DATABASE_FILE, help=f"Local database (default: {DATABASE_FILE})")
+
+    # arguments for modules that can read scans from the local database
+    _local = argparse.ArgumentParser(add_help=False, parents=[_db])
+    _local.add_argument("--local", action="store_true", help="Read scans from the local database of 'nut sync'")
+
     # --- Main Parser ---
 
     # nut -h -> module.help, nut [module] -h -> module.description
@@ -91,12 +174,31 @@ def parse_args():
 
     # --- Create ---
     _text = "Create scans and folders defined in a .yml file"
-    parser_create = subparsers.add_parser("create", parents=[_common], help=_text, description=_text)
+    parser_create = subparsers.add_parser("create", parents=[_common, _workers], help=_text, description=_text)
     parser_create.add_argument("file", type=path_file, help="Yaml file with the scan definitions")
+    parser_create.add_argument(
+        "--dry-run", action="store_true", help="Print which scans would be created, updated, or skipped"
+    )
+
+    # --- Diff ---
+    _text = "Compare the findings of an old and a new scan"
+    _diff_format = _format_parser("plain", "jsonl", "csv")
+    parser_diff = subparsers.add_parser(
+        "diff", parents=[_common, _diff_format, _local, _workers], help=_text, description=_text
+    )
+    parser_diff.add_argument("old", metavar="OLD", help="Scan ID or name of the old scan")
+    parser_diff.add_argument("new", metavar="NEW", help="Scan ID or name of the new scan")
+    parser_diff.add_argument("--full", action="store_true", help="Compare every finding, report unchanged ones too")
+    parser_diff.add_argument("-o", "--output", metavar="FILE", dest="outfile", type=Path, help="Defaults to stdout")
 
     # --- Exploits ---
     _text = "List vulnerabilities with known exploits"
-    parser_exploits = subparsers.add_parser("exploits", parents=[_common, _scans], help=_text, description=_text)
+    parser_exploits = subparsers.add_parser(
+        "exploits",
+        parents=[_common, _scans, _format, _local, _servers, _workers, _progress],
+        help=_text,
+        description=_text,
+    )
     framework_group = parser_exploits.add_mutually_exclusive_group()
     framework_group.set_defaults(framework=None)
     framework_group.add_argument("-ms", "--metasploit", action="store_const", dest="framework", const="metasploit")
@@ -104,61 +206,233 @@ def parse_args():
 
     # --- Export ---
     _text = "Export scans as .nessus files"
-    parser_export = subparsers.add_parser("export", parents=[_common, _scans], help=_text, description=_text)
+    parser_export = subparsers.add_parser(
+        "export", parents=[_common, _scans, _servers, _workers, _progress], help=_text, description=_text
+    )
     parser_export.add_argument("-m", "--merge", action="store_true", help="Merge all scans into one")
     parser_export.add_argument("-o", "--outdir", type=Path, default=Path())
 
+    # --- Hosts ---
+    _text = "Create an inventory of all hosts, plugins, and ports"
+    _hosts_format = _format_parser("jsonl", "csv")
+    parser_hosts = subparsers.add_parser(
+        "hosts", parents=[_common, _scans, _hosts_format, _local, _workers], help=_text, description=_text
+    )
+    parser_hosts.add_argument(
+        "--severity",
+        choices=SEVERITIES,
+        help="Only plugins with at least this severity",
+    )
+    parser_hosts.add_argument("--plugins", metavar="ID", nargs="+", type=int, help="Only these plugins")
+    parser_hosts.add_argument("-o", "--output", metavar="FILE", dest="outfile", type=Path, help="Defaults to stdout")
+
     # --- List ---
     _text = "List folders, scans, and scan policies"
-    parser_list = subparsers.add_parser("list", parents=[_common], help=_text, description=_text)
+    _list_format = _format_parser("table", "plain", "jsonl", "csv")
+    parser_list = subparsers.add_parser(
+        "list", parents=[_common, _list_format, _servers], help=_text, description=_text
+    )
     list_group = parser_list.add_mutually_exclusive_group()
     list_group.add_argument("-s", "--scans", action="store_true", help="Include scans in each folder")
     list_group.add_argument("-p", "--policies", action="store_true", help="List available scan policies")
+    list_filters = parser_list.add_argument_group("scan filters", "Filters for the listed scans, implies --scans")
+    list_filters.add_argument("--folder", help="Only scans in this folder (ID or name)")
+    list_filters.add_argument("--name", metavar="GLOB", help="Only scans whose name matches the glob")
+    list_filters.add_argument("--regex", help="Only scans whose name matches the regex")
+    list_filters.add_argument("--status", nargs="+", help="Only scans with one of these statuses")
+    list_filters.add_argument("--since", metavar="DATE", type=date_timestamp, help="Only scans modified since")
+
+    # --- Query ---
+    _text = "Query the findings in the local database of 'nut sync'"
+    _query_format = _format_parser("plain", "jsonl", "csv")
+    parser_query = subparsers.add_parser(
+        "query", parents=[_common, _scans, _query_format, _db], help=_text, description=_text
+    )
+    parser_query.set_defaults(uses_scans=False, local=True)  # scans are optional and resolved locally
+    parser_query.add_argument("--plugins", metavar="ID", nargs="+", type=int, help="Only these plugins")
+    parser_query.add_argument("--hosts", metavar="HOST", nargs="+", help="Only these hosts")
+    parser_query.add_argument("--ports", metavar="PORT", nargs="+", type=int, help="Only these ports")
+    parser_query.add_argument("--services", metavar="SERVICE", nargs="+", help="Only these services (e.g. www)")
+    parser_query.add_argument(
+        "--severity",
+        choices=SEVERITIES,
+        help="Only plugins with at least this severity",
+    )
+    parser_query.add_argument("--exploitable", action="store_true", help="Only plugins with known exploits")
+    parser_query.add_argument("--sql", help="Run a raw SQL query on the read-only database instead")
 
     # --- URLs ---
     _text = "Create a list of all identified web servers"
-    parser_urls = subparsers.add_parser("urls", parents=[_common, _scans], help=_text, description=_text)
-    parser_urls.add_argument("-o", "--output", metavar="FILE", dest="outfile", type=Path, default=Path("urls.txt"))
-
-    parser.parse_args(namespace=args)
+    parser_urls = subparsers.add_parser(
+        "urls",
+        parents=[_common, _scans, _format, _local, _servers, _workers, _progress],
+        help=_text,
+        description=_text,
+    )
+    parser_urls.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        dest="outfile",
+        type=Path,
+        help="Output file, defaults to urls.txt for table and stdout for jsonl/csv",
+    )
+
+    # --- Run ---
+    _text = "Run several modules on the same scans, fetching shared data only once"
+    parser_run = subparsers.add_parser(
+        "run", parents=[_common, _scans, _servers, _workers, _progress], help=_text, description=_text
+    )
+    parser_run.add_argument("modules", metavar="MODULE", nargs="+", choices=PIPELINE_MODULES, help="Modules to run")
+    parser_run.set_defaults(format="table")
+    run_group = parser_run.add_mutually_exclusive_group()
+    run_group.set_defaults(framework=None)
+    run_group.add_argument("-ms", "--metasploit", action="store_const", dest="framework", const="metasploit")
+    run_group.add_argument("-co", "--core-impact", action="store_const", dest="framework", const="core")
+    parser_run.add_argument("-m", "--merge", action="store_true", help="export: Merge all scans into one")
+    parser_run.add_argument("-o", "--outdir", type=Path, default=Path(), help="export: Output directory")
+    parser_run.add_argument("--urls-output", metavar="FILE", dest="outfile", type=Path, help="urls: Output file")
+
+    # --- Sync ---
+    _text = "Store the findings of scans in the local database"
+    parser_sync = subparsers.add_parser(
+        "sync", parents=[_common, _scans, _db, _workers], help=_text, description=_text
+    )
+    parser_sync.add_argument("--force", action="store_true", help="Sync scans even if they haven't changed")
+
+    # --- Serve ---
+    _text = "Keep a session and caches warm and run forwarded commands"
+    parser_serve = subparsers.add_parser("serve", parents=[_common], help=_text, description=_text)
+    parser_serve.add_argument("--ttl", type=float, default=300, help="Seconds to cache responses (default: 300)")
+
+    parser.parse_args(argv, namespace=args)
+
+    # Ensure that the servers are configured
+    if getattr(args, "servers", None):
+        sections = get_server_sections()
+
+        # Sections without a URL are left out, e.g. an empty [nessus] section
+        if "all" in args.servers:
+            args.servers = [server for server, section in sections.items() if config[section].get("url")]
+
+        unknown = [server for server in args.servers if server not in sections]
+        if unknown:
+            parser.error(f"servers not found in the config: {', '.join(unknown)}")
+
+        args.servers = list(dict.fromkeys(args.servers))
 
     # Ensure that scans/folders were passed if the module uses scans ids
     if args.uses_scans and not (args.scans or args.folders):
         parser.error("at least one of the following arguments is required: scans, folders")
 
 
-def main():
-    parse_args()
+def execute():
+    """Runs the module selected by the parsed arguments."""
+
+    # Imported here, so forwarding to 'nut serve' doesn't pay for them
+    from nut.servers import get_client, is_fan_out, resolve_server_scan_ids
+    from nut.utils import nessus
 
-    setup_logging(args.loglevel)
     logger.debug(f"{args=}")
 
-    logger.info("Connecting to Nessus")
+    # Always select the client, a server runs commands with and without
+    # '--local' or '--servers' one after another
+    if getattr(args, "local", False):
+        from nut.database import LocalNessus
+
+        # Also covers 'query', which always reads from the database
+        if not args.db.exists():
+            logger.error(f"Database '{args.db}' doesn't exist, run 'nut sync' first")
+            return
+
+        nessus.use(LocalNessus(args.db))
+        server = None
+        servers = []
+    else:
+        args.servers = getattr(args, "servers", None) or [DEFAULT_SERVER]
+        server, servers = args.servers[0], args.servers
+
+        logger.info("Connecting to Nessus")
+        logger.debug(f"Servers: {args.servers}")
+        nessus.use(get_client(server))
+
+        for client in map(get_client, servers):
+            client.set_concurrency(getattr(args, "workers", None))
 
-    if args.uses_scans:
+            # All modules of a pipeline work on the same scans, so every listing
+            # and detail only has to be fetched once for the whole pipeline. A
+            # cache that's already enabled (by 'nut serve') keeps its TTL.
+            if args.module == "run" and not client.cache_enabled:
+                client.enable_cache()
+
+    # With several servers, the scans are resolved on each of them by the modules
+    if args.uses_scans and not is_fan_out():
         logger.debug("Resolving scan ids")
 
-        args.scan_ids = resolve_scan_ids(args.scans, args.folders)
+        args.scan_ids = resolve_server_scan_ids(server)
         if not args.scan_ids:
             logger.error("No valid scan ids found, please check your input")
             return
 
     # --- Modules ---
-    from nut.modules import create, exploits, export, list, urls
+    from nut.modules import create, diff, exploits, export, hosts, list, query, sync, urls
+
+    modules = {
+        "create": create.run,
+        "diff": diff.run,
+        "exploits": exploits.run,
+        "export": export.run,
+        "hosts": hosts.run,
+        "list": list.run,
+        "query": query.run,
+        "sync": sync.run,
+        "urls": urls.run,
+    }
+
+    from nut.progress import tracking
+
+    def _run_module(module: str):
+        units = PROGRESS_UNITS.get(module)
+        with tracking(module, units or (), enabled=units is not None and args.progress):
+            modules[module]()
+
+    if args.module == "run":
+        for module in dict.fromkeys(args.modules):
+            logger.info(f"Running module '{module}'")
+            _run_module(module)
 
-    if args.module == "create":
-        create.run()
-    elif args.module == "exploits":
-        exploits.run()
-    elif args.module == "export":
-        export.run()
-    elif args.module == "list":
-        list.run()
-    elif args.module == "urls":
-        urls.run()
+    else:
+        _run_module(args.module)
+
+    # How many concurrent requests each server handled
+    for server in servers:
+        logger.debug(f"Concurrency on '{server}': {get_client(server).limiter.summary()}")
+
+
+def main():
+    parse_args()
+
+    if args.module == "serve":
+        from nut.daemon import serve
+
+        setup_logging(args.loglevel)
+        serve(args.ttl)
+        return
+
+    # Let a running 'nut serve' handle the command, which has a warm session
+    # and caches. If there is none, run it in this process.
+    if not args.direct:
+        exit_code = forward(sys.argv[1:])
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    setup_logging(args.loglevel)
+    execute()
 
 
 if __name__ == "__main__":
+    from nessus.exceptions import NessusException
+
     try:
         main()
     except NessusException as e:
@@ -1,13 +1,17 @@
 import copy
 import logging
+import re
+import sys
+from collections import defaultdict
 from typing import Optional, Union
 
 import yaml
 from nessus.models import ScanCreateSettings
 from yaml.scanner import ScannerError
 
+from nut.output import render_plain
 from nut.settings import args
-from nut.utils import nessus, resolve_targets
+from nut.utils import concurrent_map, nessus, resolve_targets
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +24,7 @@ class FolderPolicyCache:
         self.policy_map = {}
         self.uuid_map = {}
 
-    def resolve_folder(self, folder: Union[int, str]) -> Optional[int]:
+    def resolve_folder(self, folder: Union[int, str], create: bool = True) -> Optional[int]:
         if isinstance(folder, int):
             return folder
 
@@ -33,7 +37,7 @@ class FolderPolicyCache:
                 folder_id = nessus.get_folder_id(folder)
 
             # If unsuccessful, create it
-            if folder_id is None:
+            if folder_id is None and create:
                 logger.info(f"Creating folder '{folder}'")
                 response = nessus.folders_create(folder)
                 folder_id = response.get("id")
@@ -70,8 +74,104 @@ class FolderPolicyCache:
             return policy_uuid
 
 
-def create_scans(definitions: dict):
-    """Creates the scans and folders as per the supplied definitions."""
+def _get_editor_values(editor: dict) -> dict:
+    """Returns the current values of the inputs in the editor form of a scan."""
+
+    values = {}
+
+    # The inputs are nested in sections and groups, which differ between
+    # Nessus versions, so they're searched for everywhere
+    def _collect(node):
+        if isinstance(node, dict):
+            if "id" in node and "default" in node:
+                values.setdefault(node["id"], node["default"])
+            for value in node.values():
+                _collect(value)
+
+        elif isinstance(node, list):
+            for value in node:
+                _collect(value)
+
+    _collect(editor.get("settings", {}))
+
+    return values
+
+
+def _target_set(text_targets: str) -> set[str]:
+    """Splits the targets of a scan, which Nessus may separate by commas or newlines."""
+    return {target.lower() for target in re.split(r"[,\s]+", text_targets) if target}
+
+
+# Settings of existing scans that the definitions don't manage, an update
+# sends their current values so it doesn't reset them (e.g. re-enable a
+# disabled schedule)
+KEPT_SETTINGS = ["enabled", "launch", "rrules", "starttime", "timezone"]
+
+
+def _get_changes(values: dict, text_targets: str, description: Optional[str]) -> list[str]:
+    """Returns the settings of the existing scan that differ from its definition."""
+
+    changes = []
+
+    if _target_set(values.get("text_targets") or "") != _target_set(text_targets):
+        changes.append("targets")
+
+    if (values.get("description") or "") != (description or ""):
+        changes.append("description")
+
+    return changes
+
+
+def _plan_scan(job: dict) -> dict:
+    """Returns the plan entry of the scan, with the action and the changed settings."""
+
+    changes = []
+    kept = {}
+
+    if job["scan_id"] is not None:
+        values = _get_editor_values(nessus.editor_scan_details(job["scan_id"]))
+
+        changes = _get_changes(values, job["text_targets"], job["description"])
+        kept = {setting: values[setting] for setting in KEPT_SETTINGS if setting in values}
+
+        action = "update" if changes else "skip"
+    else:
+        action = "create"
+
+    logger.debug(f"Scan '{job['scan']}': {action}")
+
+    return {"action": action, **job, "changes": changes, "kept": kept}
+
+
+def _apply_scan(entry: dict):
+    """Creates or updates the scan of the plan entry."""
+
+    scan_settings = ScanCreateSettings(
+        name=entry["scan"],
+        text_targets=entry["text_targets"],
+        description=entry["description"],
+        policy_id=entry["policy_id"],
+        folder_id=entry["folder_id"],
+    )
+
+    if entry["action"] == "create":
+        logger.info(f"Creating scan '{entry['scan']}'")
+        nessus.scans_create(entry["template_uuid"], scan_settings)
+    else:
+        logger.info(f"Updating the {' and '.join(entry['changes'])} of scan '{entry['scan']}'")
+        settings = {**scan_settings.model_dump(), **entry["kept"]}
+        nessus.scans_configure(entry["scan_id"], entry["template_uuid"], settings)
+
+
+def create_scans(definitions: dict, dry_run: bool = False, workers: Optional[int] = None):
+    """
+    Creates the scans and folders as per the supplied definitions.
+
+    Scans that already exist in their folder are skipped, or updated if their
+    targets or description changed, so the definitions can be applied again
+    after a partial failure. With 'dry_run', nothing is created or changed
+    and the plan is printed instead.
+    """
 
     logger.info(f"Parsing scan definitions")
 
@@ -85,9 +185,22 @@ def create_scans(definitions: dict):
         logger.error("Invalid key 'scans' in definitions, not a dict")
         return
 
+    # Fetch the existing scans and folders once for all definitions. A cached
+    # listing (e.g. of 'nut serve') may miss scans created since, which
+    # would be created again.
+    nessus.clear_cache()
+    data = nessus.scans_list()
+
     cache = FolderPolicyCache()
+    cache.folder_map.update({f["name"]: f["id"] for f in data["folders"]})
+
+    # Maps folder ids and scan names to ids of existing scans
+    existing_scans = defaultdict(list)
+    for existing_scan in data["scans"] or []:
+        existing_scans[(existing_scan["folder_id"], existing_scan["name"])].append(existing_scan["id"])
+
     defaults = definitions.get("defaults", {})
-    scans_created = 0
+    jobs = []
 
     for name, details in scan_defs.items():
         if not isinstance(details, dict):
@@ -131,8 +244,9 @@ def create_scans(definitions: dict):
             logger.error(f"Scan '{name}' is missing the folder, skipping")
             continue
 
-        folder_id = cache.resolve_folder(folder)
-        if folder_id is None:
+        # Folders aren't created in a dry run, scans in them are new anyway
+        folder_id = cache.resolve_folder(folder, create=not dry_run)
+        if folder_id is None and not (dry_run and isinstance(folder, str)):
             logger.error(f"Scan '{name}' has an invalid folder, skipping")
             continue
 
@@ -160,20 +274,46 @@ def create_scans(definitions: dict):
         if description is not None:
             description = str(description)  # just to be sure
 
-        # Create the scan
-        scan_settings = ScanCreateSettings(
-            name=name,
-            text_targets=text_targets,
-            description=description,
-            policy_id=policy_id,
-            folder_id=folder_id,
+        # Check if the scan already exists in the folder
+        scan_ids = existing_scans.get((folder_id, name), [])
+        if len(scan_ids) > 1:
+            logger.error(f"Scan '{name}' exists {len(scan_ids)} times in the folder, skipping")
+            continue
+
+        # An empty description also clears the description of an existing scan
+        jobs.append(
+            {
+                "scan": name,
+                "folder": folder,
+                "scan_id": scan_ids[0] if scan_ids else None,
+                "template_uuid": template_uuid,
+                "text_targets": text_targets,
+                "description": description or "",
+                "policy_id": policy_id,
+                "folder_id": folder_id,
+            }
         )
 
-        logger.info(f"Creating scan '{name}'")
-        nessus.scans_create(template_uuid, scan_settings)
-        scans_created += 1
+    # Existing scans are compared and changed concurrently, the plan keeps the
+    # order of the definitions
+    plan = list(concurrent_map(_plan_scan, jobs, workers, ordered=True))
+
+    if not dry_run:
+        for _ in concurrent_map(_apply_scan, [entry for entry in plan if entry["action"] != "skip"], workers):
+            pass
+
+    counts = {action: sum(1 for entry in plan if entry["action"] == action) for action in ("create", "update", "skip")}
+
+    if dry_run:
+        if plan:
+            headers = ["action", "scan", "folder", "changes"]
+            rows = [[entry["action"], entry["scan"], entry["folder"], ", ".join(entry["changes"])] for entry in plan]
+            sys.stdout.write(f"{render_plain(headers, rows)}\n")
+
+        logger.info(f"Would create {counts['create']} scans, update {counts['update']}, and skip {counts['skip']}")
+        return
 
-    logger.info(f"Created {scans_created} scans")
+    logger.info(f"Created {counts['create']} scans, updated {counts['update']}, skipped {counts['skip']} unchanged")
 
 
 def run():
@@ -189,4 +329,4 @@ def run():
         logger.error("The input file is empty")
         return
 
-    create_scans(definitions)
+    create_scans(definitions, args.dry_run, args.workers)
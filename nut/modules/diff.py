@@ -0,0 +1,237 @@
+import logging
+import sys
+from collections import defaultdict
+from hashlib import blake2b
+from typing import Iterator, Optional
+
+from nessus.exceptions import NessusException
+
+from nut.output import MACHINE_FORMATS, RecordWriter, render_plain
+from nut.settings import SEVERITIES, args
+from nut.utils import concurrent_map, iter_plugin_records, nessus, resolve_scan_ids
+
+logger = logging.getLogger(__name__)
+
+# Fields of the diff records
+FIELDS = ["status", "host", "port", "proto", "service", "plugin_id", "plugin_name", "severity"]
+
+# Order of the statuses in the output
+STATUSES = ["new", "fixed", "unchanged"]
+
+
+def fingerprint(*parts) -> int:
+    """Returns a compact 64-bit hash of the parts."""
+
+    data = "\0".join(str(part) for part in parts).encode()
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "big")
+
+
+def _host_fingerprint(plugins: dict[int, int]) -> int:
+    """Fingerprints the plugins of a host and how often each was reported."""
+    return fingerprint(*sorted(plugins.items()))
+
+
+class ScanDiff:
+    """
+    Compares the findings of two scans.
+
+    Every (host, plugin, port) finding is reduced to a 64-bit fingerprint, so
+    the findings of both scans can be compared as sets of integers. To keep
+    diffs of large scans cheap, the plugins of every host, and how many ports
+    each was reported on, are fingerprinted and compared first. This costs
+    one host details request per host and scan, but the plugin details are
+    only fetched for the hosts whose fingerprint changed, and only new and
+    fixed findings are reported. A finding that moved to another port
+    without changing the number of ports of any plugin on the host is only
+    found with 'full', which compares every plugin of every host and
+    reports the unchanged findings as well.
+    """
+
+    def __init__(self, old_id: int, new_id: int, full: bool = False, workers: Optional[int] = None):
+        self.old_id = old_id
+        self.new_id = new_id
+        self.full = full
+        self.workers = workers
+
+        # Name and severity of every plugin in either scan
+        self.plugins = {}
+
+    def _get_hosts(self, scan_id: int) -> dict[str, dict]:
+        """Returns the hosts of the scan by hostname."""
+
+        scan_details = nessus.get_scan_details(scan_id)
+
+        for vulnerability in scan_details.get("vulnerabilities") or []:
+            self.plugins[vulnerability["plugin_id"]] = (vulnerability["plugin_name"], vulnerability["severity"])
+
+        return {host["hostname"]: host for host in scan_details.get("hosts") or []}
+
+    @staticmethod
+    def _get_host_plugins(job: tuple) -> tuple:
+        """Returns the plugins reported for the host, with how often each was reported."""
+
+        scan_id, host = job
+
+        try:
+            host_details = nessus.scans_host_details(scan_id, host["host_id"])
+        except NessusException:
+            logger.error(f"Couldn't fetch host '{host['hostname']}' of scan '{scan_id}', skipping")
+            return scan_id, host["hostname"], None
+
+        plugins = {v["plugin_id"]: v.get("count", 1) for v in host_details.get("vulnerabilities") or []}
+
+        return scan_id, host["hostname"], plugins
+
+    def _compared_plugins(self, old_plugins: dict, new_plugins: dict) -> set[int]:
+        """Returns the plugins of a host whose details have to be compared."""
+
+        # Findings can move between ports, so every plugin of a changed host is compared
+        if self.full or _host_fingerprint(old_plugins) != _host_fingerprint(new_plugins):
+            return old_plugins.keys() | new_plugins.keys()
+
+        return set()
+
+    @staticmethod
+    def _get_plugin_outputs(job: tuple) -> tuple:
+        scan_id, plugin_id = job
+
+        try:
+            plugin_details = nessus.get_plugin_details(scan_id, plugin_id)
+        except NessusException:
+            logger.error(f"Couldn't fetch plugin '{plugin_id}' of scan '{scan_id}', skipping")
+            return scan_id, plugin_id, []
+
+        return scan_id, plugin_id, plugin_details.get("outputs") or []
+
+    def iter_records(self) -> Iterator[dict]:
+        """Yields the new and fixed findings, and the unchanged ones with 'full'."""
+
+        hosts = {self.old_id: self._get_hosts(self.old_id), self.new_id: self._get_hosts(self.new_id)}
+
+        # The plugins of every host in each scan
+        host_jobs = [(scan_id, host) for scan_id, scan_hosts in hosts.items() for host in scan_hosts.values()]
+
+        host_plugins = {self.old_id: {}, self.new_id: {}}
+        for scan_id, hostname, plugins in concurrent_map(self._get_host_plugins, host_jobs, self.workers):
+            host_plugins[scan_id][hostname] = plugins
+
+        # Maps the (scan, plugin) pairs whose details are needed to the hosts
+        # they're needed for
+        plugin_hosts = defaultdict(set)
+        changed = 0
+
+        for hostname in hosts[self.old_id].keys() | hosts[self.new_id].keys():
+            old_plugins = host_plugins[self.old_id].get(hostname, {})
+            new_plugins = host_plugins[self.new_id].get(hostname, {})
+
+            # Hosts that couldn't be fetched can't be compared
+            if old_plugins is None or new_plugins is None:
+                continue
+
+            if _host_fingerprint(old_plugins) != _host_fingerprint(new_plugins):
+                changed += 1
+
+            for plugin_id in self._compared_plugins(old_plugins, new_plugins):
+                for scan_id, plugins in ((self.old_id, old_plugins), (self.new_id, new_plugins)):
+                    if plugin_id in plugins:
+                        plugin_hosts[(scan_id, plugin_id)].add(hostname)
+
+        total = len(hosts[self.old_id].keys() | hosts[self.new_id].keys())
+        logger.info(f"{changed} of {total} hosts changed")
+
+        if not plugin_hosts:
+            return
+
+        logger.info(f"Fetching the details of {len(plugin_hosts)} plugins")
+
+        # Fingerprints of the compared findings in each scan, with the finding
+        # for the fingerprints that end up in the output
+        fingerprints = {self.old_id: set(), self.new_id: set()}
+        findings = {}
+
+        for scan_id, plugin_id, outputs in concurrent_map(self._get_plugin_outputs, list(plugin_hosts), self.workers):
+            wanted = plugin_hosts[(scan_id, plugin_id)]
+
+            for record in iter_plugin_records(outputs):
+                if record.host not in wanted:
+                    continue
+
+                key = fingerprint(record.host, plugin_id, record.port, record.proto)
+                fingerprints[scan_id].add(key)
+                findings.setdefault(key, (plugin_id, record))
+
+        old, new = fingerprints[self.old_id], fingerprints[self.new_id]
+
+        statuses = {"new": new - old, "fixed": old - new}
+
+        # Without 'full', the findings of unchanged hosts aren't fetched, so
+        # the unchanged findings would only be a fraction of them
+        if self.full:
+            statuses["unchanged"] = old & new
+
+        for status in STATUSES:
+            if status not in statuses:
+                continue
+
+            records = [self._record(status, *findings[key]) for key in statuses[status]]
+            records.sort(key=lambda r: (-SEVERITIES.index(r["severity"]), r["plugin_id"], r["host"], r["port"]))
+
+            logger.info(f"{len(records)} {status} findings")
+            yield from records
+
+    def _record(self, status: str, plugin_id: int, record) -> dict:
+        plugin_name, severity = self.plugins.get(plugin_id, (None, 0))
+
+        return {
+            "status": status,
+            "host": record.host,
+            "port": record.port,
+            "proto": record.proto,
+            "service": record.service,
+            "plugin_id": plugin_id,
+            "plugin_name": plugin_name,
+            "severity": SEVERITIES[severity],
+        }
+
+
+def _resolve_scan(scan: str) -> Optional[int]:
+    """Resolves the scan id, name, or pattern into a single scan id."""
+
+    scan_ids = resolve_scan_ids([scan], [])
+
+    if len(scan_ids) != 1:
+        if scan_ids:
+            logger.error(f"'{scan}' matches {len(scan_ids)} scans, but has to match exactly one")
+        return None
+
+    return scan_ids[0]
+
+
+def run():
+    old_id, new_id = _resolve_scan(args.old), _resolve_scan(args.new)
+    if old_id is None or new_id is None:
+        return
+
+    logger.info(f"Comparing scan '{old_id}' with scan '{new_id}'")
+
+    records = ScanDiff(old_id, new_id, args.full, args.workers).iter_records()
+
+    if args.format in MACHINE_FORMATS:
+        if args.outfile is None:
+            RecordWriter(args.format, FIELDS).write_all(records)
+            return
+
+        logger.info(f"Writing diff to '{args.outfile}'")
+        with args.outfile.open("w", newline="") as fp:
+            RecordWriter(args.format, FIELDS, fp).write_all(records)
+        return
+
+    rows = [[record[field] for field in FIELDS] for record in records]
+    table = render_plain(FIELDS, rows, right={FIELDS.index("port"), FIELDS.index("plugin_id")})
+
+    if args.outfile is None:
+        sys.stdout.write(f"{table}\n")
+        return
+
+    logger.info(f"Writing diff to '{args.outfile}'")
+    args.outfile.write_text(f"{table}\n")
@@ -1,23 +1,119 @@
 import json
 import logging
+from array import array
 from collections import defaultdict
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 from nessus.models import ScanFilters
 from prettytable import PrettyTable
 
+from nut import progress
+from nut.output import MACHINE_FORMATS, RecordWriter
+from nut.servers import is_fan_out, iter_server_records, namespace, run_on_servers
 from nut.settings import args
-from nut.utils import nessus, sort_hosts
+from nut.utils import HostSorter, concurrent_map, iter_plugin_records, join_host, nessus
 
 logger = logging.getLogger(__name__)
 
+# Fields of the records in machine-readable output
+FIELDS = ["scan_id", "scan_name", "plugin_id", "plugin_name", "host", "port", "proto", "exploits"]
+
+
+class _PluginEntry:
+    """The exploits of a plugin and its targets in every scan."""
+
+    __slots__ = ("exploits", "targets")
+
+    def __init__(self):
+        # Interned tuple of (framework, exploit names) pairs
+        self.exploits = ()
+
+        # Maps scan indexes to the packed targets in the scan
+        self.targets = {}
+
+
+class ExploitStore:
+    """
+    Compact store for the results of the ExploitFinder.
+
+    Results of large folders contain hundreds of thousands of targets, but
+    only a fraction as many distinct hosts, scans, and exploits. These are
+    stored once and referenced by their index. Each target is packed into a
+    single integer (host index and port) and the targets of a plugin in a
+    scan are kept in an array instead of a list of strings. Only the names
+    of the exploits are kept, they're all that is printed.
+    """
+
+    def __init__(self):
+        self.plugins = {}
+
+        # Index -> value and value -> index of the hosts and scans
+        self.hosts = []
+        self._host_ids = {}
+        self.scans = []
+        self._scan_ids = {}
+
+        # Every distinct set of exploits is only stored once
+        self._exploits = {}
+
+    def __len__(self):
+        return len(self.plugins)
+
+    def _host_id(self, host: str) -> int:
+        try:
+            return self._host_ids[host]
+        except KeyError:
+            self.hosts.append(host)
+            host_id = self._host_ids[host] = len(self.hosts) - 1
+            return host_id
+
+    def _scan_id(self, scan: tuple) -> int:
+        try:
+            return self._scan_ids[scan]
+        except KeyError:
+            self.scans.append(scan)
+            scan_id = self._scan_ids[scan] = len(self.scans) - 1
+            return scan_id
+
+    def add(self, plugin: tuple, scan: tuple, exploits: dict, targets: Iterable[tuple[str, int]]):
+        """
+        Adds the targets of the plugin in the scan. The exploits map framework
+        names to exploit names and are merged with the plugin's exploits.
+        """
+
+        entry = self.plugins.get(plugin)
+        if entry is None:
+            entry = self.plugins[plugin] = _PluginEntry()
+
+        if exploits:
+            merged = dict(entry.exploits)
+            merged.update((framework, tuple(names)) for framework, names in exploits.items())
+
+            merged = tuple(merged.items())
+            entry.exploits = self._exploits.setdefault(merged, merged)
+
+        packed = entry.targets.setdefault(self._scan_id(scan), array("Q"))
+        packed.extend(self._host_id(host) << 16 | port for host, port in targets)
+
+    def iter_targets(self, packed: array) -> Iterator[tuple[str, int]]:
+        for target in packed:
+            yield self.hosts[target >> 16], target & 0xFFFF
+
+    def __iter__(self) -> Iterator[tuple]:
+        """Yields every plugin with its exploits and its (scan, targets) pairs."""
+
+        for plugin, entry in self.plugins.items():
+            scans = ((self.scans[scan_id], self.iter_targets(packed)) for scan_id, packed in entry.targets.items())
+            yield plugin, dict(entry.exploits), scans
+
 
 class ExploitFinder:
-    def __init__(self, scan_ids: list[int], framework: Optional[str] = str):
-        self.data = {}
+    def __init__(self, scan_ids: list[int], framework: Optional[str] = str, workers: Optional[int] = None):
+        self.data = ExploitStore()
 
         self.scan_ids = scan_ids
         self.framework = framework
+        self.workers = workers
         self.filters = self._get_filters()
 
     @staticmethod
@@ -48,22 +144,16 @@ class ExploitFinder:
         return dict(exploits_dict)
 
     @staticmethod
-    def _get_targets(plugin_outputs: dict):
-        hostlist = set()
-
-        for output in plugin_outputs:
-            for info, targets in output["ports"].items():
-                # 'Info' stores how Nessus groups hosts into ports. It looks
-                # like this: 80 / tcp / tcp
-                port = info.split(" / ", 1)[0]
+    def _get_targets(plugin_outputs: list[dict]) -> Iterator[tuple[str, int]]:
+        hosts = HostSorter()
 
-                for target in targets:
-                    if port == "0":
-                        hostlist.add(target["hostname"])
-                    else:
-                        hostlist.add(f"{target['hostname']}:{port}")
+        # The protocol is left out, so a port that's reported for both tcp and
+        # udp is only listed once. Port 0 means the finding isn't port-specific
+        for record in iter_plugin_records(plugin_outputs):
+            hosts.add_parts(record.host, record.port)
 
-        return sort_hosts(hostlist)
+        for host, port, _ in hosts.iter_parts():
+            yield host, port
 
     def _get_filters(self) -> ScanFilters:
         """Returns a ScanFilters instance for filtering the scan details."""
@@ -82,66 +172,138 @@ class ExploitFinder:
 
         return ScanFilters.model_validate({"search_type": "and", "filters": filter_defs})
 
-    def _add_data(self, plugin_id: int, plugin_name: str, scan_id: int, scan_name: str, exploits: dict, targets: list):
-        plugin = (plugin_id, plugin_name)
-        scan = (scan_id, scan_name)
+    def _add_data(
+        self, plugin_id: int, plugin_name: str, scan_id: int, scan_name: str, exploits: dict, targets: Iterable
+    ):
+        # Only the names of the exploits are printed
+        exploit_names = {framework: [e["name"] for e in items] for framework, items in exploits.items()}
+
+        self.data.add((plugin_id, plugin_name), (scan_id, scan_name), exploit_names, targets)
 
-        if plugin not in self.data:
-            self.data[plugin] = {
-                "exploits": defaultdict(set),
-                "targets": defaultdict(set),
-            }
+    @staticmethod
+    def _get_plugin_details(job: tuple[int, int]) -> dict:
+        scan_id, plugin_id = job
 
-        self.data[plugin]["exploits"].update(exploits)
-        self.data[plugin]["targets"][scan].update(targets)
+        plugin_details = nessus.get_plugin_details(scan_id, plugin_id)
+        progress.advance("plugins")
+
+        return plugin_details
+
+    def _iter_plugins(self):
+        """Yields the exploits and outputs of every matching plugin of every scan."""
+
+        progress.add_total("scans", len(self.scan_ids))
 
-    def start(self):
         for scan_id in self.scan_ids:
             scan_details = nessus.get_scan_details(scan_id, filters=self.filters)
             scan_name = scan_details["info"]["name"]
 
             vulnerabilities = scan_details.get("vulnerabilities", [])
-            for vulnerability in vulnerabilities:
+            progress.add_total("plugins", len(vulnerabilities))
+
+            # The plugin details are fetched concurrently, but kept in order
+            jobs = [(scan_id, vulnerability["plugin_id"]) for vulnerability in vulnerabilities]
+            results = concurrent_map(self._get_plugin_details, jobs, self.workers, ordered=True)
+
+            for vulnerability, plugin_details in zip(vulnerabilities, results):
                 plugin_id = vulnerability["plugin_id"]
                 plugin_name = vulnerability["plugin_name"]
-                plugin_details = nessus.get_plugin_details(scan_id, plugin_id)
 
                 vuln_info = plugin_details["info"]["plugindescription"]["pluginattributes"]["vuln_information"]
                 exploits = self._get_exploits(vuln_info)
 
                 plugin_outputs = plugin_details["outputs"]
-                targets = self._get_targets(plugin_outputs)
 
-                self._add_data(plugin_id, plugin_name, scan_id, scan_name, exploits, targets)
+                yield plugin_id, plugin_name, scan_id, scan_name, exploits, plugin_outputs
+
+            progress.advance("scans")
+
+    def start(self):
+        for plugin_id, plugin_name, scan_id, scan_name, exploits, plugin_outputs in self._iter_plugins():
+            targets = self._get_targets(plugin_outputs)
+            self._add_data(plugin_id, plugin_name, scan_id, scan_name, exploits, targets)
+
+    def update(self, other: "ExploitFinder", server: str):
+        """Adds the results of a finder that ran on another server."""
+
+        for plugin, exploits, scans in other.data:
+            for (scan_id, scan_name), targets in scans:
+                self.data.add(plugin, (namespace(server, scan_id), scan_name), exploits, targets)
+
+    def iter_records(self) -> Iterator[dict]:
+        """Yields a record for every affected host and port as soon as it's found."""
+
+        for plugin_id, plugin_name, scan_id, scan_name, exploits, plugin_outputs in self._iter_plugins():
+            # Only the exploit names are of interest, the rest is mostly metadata
+            exploit_names = {framework: [e["name"] for e in items] for framework, items in exploits.items()}
+
+            for record in iter_plugin_records(plugin_outputs):
+                yield {
+                    "scan_id": scan_id,
+                    "scan_name": scan_name,
+                    "plugin_id": plugin_id,
+                    "plugin_name": plugin_name,
+                    "host": record.host,
+                    "port": record.port,
+                    "proto": record.proto,
+                    "exploits": exploit_names,
+                }
 
     def print(self):
         print("\n")
 
-        for plugin, data in self.data.items():
+        for plugin, exploits, scans in self.data:
             plugin_id, plugin_name = plugin
 
             print(f"{plugin_name}")
 
-            for framework, exploits in data["exploits"].items():
-                exploits_str = ", ".join([e["name"] for e in exploits])
+            for framework, exploit_names in exploits.items():
+                exploits_str = ", ".join(exploit_names)
                 print(f"  {framework}: {exploits_str}")
 
             print()
 
-            for scan, targets in data["targets"].items():
+            for scan, targets in scans:
                 scan_id, scan_name = scan
 
                 print(f"  {scan_name} ({scan_id})")
 
-                for target in targets:
-                    print(f"    {target}")
+                for host, port in targets:
+                    print(f"    {join_host(host, port, '')}")
 
             print("\n")
 
 
+def _start(_, scan_ids: list[int]) -> ExploitFinder:
+    finder = ExploitFinder(scan_ids, args.framework, args.workers)
+    finder.start()
+    return finder
+
+
 def run():
     logger.info("Searching scans for exploitable vulns")
 
-    finder = ExploitFinder(args.scan_ids, args.framework)
+    if is_fan_out():
+        if args.format in MACHINE_FORMATS:
+            records = iter_server_records(
+                lambda scan_ids: ExploitFinder(scan_ids, args.framework, args.workers).iter_records()
+            )
+            RecordWriter(args.format, FIELDS).write_all(records)
+            return
+
+        # Merge the results of all servers, in the order of the servers
+        finder = ExploitFinder([], args.framework)
+        for server, server_finder in run_on_servers(_start):
+            finder.update(server_finder, server)
+
+        finder.print()
+        return
+
+    finder = ExploitFinder(args.scan_ids, args.framework, args.workers)
+
+    if args.format in MACHINE_FORMATS:
+        RecordWriter(args.format, FIELDS).write_all(finder.iter_records())
+        return
+
     finder.start()
     finder.print()
@@ -1,19 +1,23 @@
 import logging
 from datetime import datetime
+from pathlib import Path
 
 from pathvalidate import sanitize_filename, sanitize_filepath
 
+from nut import progress
+from nut.servers import is_fan_out, run_on_servers
 from nut.settings import args
-from nut.utils import nessus
+from nut.utils import concurrent_map, nessus
 
 logger = logging.getLogger(__name__)
 
 
-def run():
-    basedir = args.outdir
-    scan_ids = args.scan_ids
+def export_scans(scan_ids: list[int], basedir: Path, merge: bool = False):
+    """Exports the scans as .nessus files into the directory."""
+
+    progress.add_total("scans", len(scan_ids))
 
-    if args.merge:
+    if merge:
         logger.info("Exporting and merging scans")
 
         scan_name = "Merged Export"
@@ -29,6 +33,8 @@ def run():
         with outfile.open("wb") as fp:
             fp.write(exported_scan.read())
 
+        progress.advance("scans", len(scan_ids))
+
     else:
         data = nessus.scans_list()
 
@@ -36,7 +42,7 @@ def run():
         scan_map = {s["id"]: (s["name"], s["folder_id"]) for s in data["scans"]}
         folder_map = {f["id"]: f["name"] for f in data["folders"]}
 
-        for scan_id in scan_ids:
+        def _export(scan_id: int):
             logger.info(f"Exporting scan '{scan_id}'")
 
             exported_scan = nessus.export_scan(scan_id)
@@ -53,3 +59,19 @@ def run():
             logger.info(f"Writing scan to '{outfile}'")
             with outfile.open("wb") as fp:
                 fp.write(exported_scan.read())
+
+            progress.advance("scans")
+
+        # Nessus prepares the exports of the scans concurrently
+        for _ in concurrent_map(_export, scan_ids, args.workers):
+            pass
+
+
+def run():
+    if is_fan_out():
+        # Every server gets its own directory. Nessus can only merge scans of
+        # the same server, so merging creates one file per server.
+        run_on_servers(lambda server, scan_ids: export_scans(scan_ids, args.outdir / server, args.merge))
+        return
+
+    export_scans(args.scan_ids, args.outdir, args.merge)
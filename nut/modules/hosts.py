@@ -0,0 +1,139 @@
+import logging
+from typing import Iterator, Optional
+
+from nessus.exceptions import NessusException
+from nessus.models import ScanFilters
+
+from nut.output import RecordWriter
+from nut.settings import SEVERITIES, args
+from nut.utils import concurrent_map, iter_plugin_records, nessus
+
+logger = logging.getLogger(__name__)
+
+# Fields of the inventory records
+FIELDS = [
+    "scan_id",
+    "scan_name",
+    "host",
+    "port",
+    "proto",
+    "service",
+    "plugin_id",
+    "plugin_name",
+    "plugin_family",
+    "severity",
+]
+
+
+class HostInventory:
+    """
+    Collects the host x plugin x port inventory of scans.
+
+    The vulnerabilities of each scan are listed with the filters applied by
+    Nessus, then the details of every remaining plugin are fetched in a pool
+    of worker threads. The plugin details contain every affected host and
+    port, which takes far fewer requests than fetching every host's plugins.
+    """
+
+    def __init__(
+        self,
+        scan_ids: list[int],
+        min_severity: Optional[str] = None,
+        plugin_ids: Optional[list[int]] = None,
+        workers: Optional[int] = None,
+    ):
+        self.scan_ids = scan_ids
+        self.min_severity = SEVERITIES.index(min_severity) if min_severity else 0
+        self.plugin_ids = set(plugin_ids) if plugin_ids else None
+        self.workers = workers
+        self.filters = self._get_filters()
+
+    def _get_filters(self) -> Optional[ScanFilters]:
+        """Returns a ScanFilters instance for filtering the scan details."""
+
+        filter_defs = []
+
+        # Nessus filters are either all 'and' or all 'or', so severities below
+        # the minimum are excluded one by one
+        for severity in range(self.min_severity):
+            filter_defs.append({"filter": "severity", "quality": "neq", "value": severity})
+
+        # Multiple plugins would need an 'or', so they're filtered in 'start()'
+        # before their details are fetched
+        if self.plugin_ids is not None and len(self.plugin_ids) == 1:
+            (plugin_id,) = self.plugin_ids
+            filter_defs.append({"filter": "plugin_id", "quality": "eq", "value": plugin_id})
+
+        if not filter_defs:
+            return None
+
+        logger.debug(f"Filtering vulns with {filter_defs}")
+        return ScanFilters.model_validate({"search_type": "and", "filters": filter_defs})
+
+    def _get_plugins(self, scan_id: int) -> Iterator[tuple]:
+        """Yields the matching plugins of the scan."""
+
+        scan_details = nessus.get_scan_details(scan_id, filters=self.filters)
+        scan_name = scan_details["info"]["name"]
+
+        vulnerabilities = scan_details.get("vulnerabilities") or []
+        logger.info(f"Scan '{scan_id}' has {len(vulnerabilities)} matching plugins")
+
+        for vulnerability in vulnerabilities:
+            plugin_id = vulnerability["plugin_id"]
+
+            if self.plugin_ids is not None and plugin_id not in self.plugin_ids:
+                continue
+
+            yield scan_id, scan_name, vulnerability
+
+    @staticmethod
+    def _get_records(plugin: tuple) -> list[dict]:
+        """Returns a record for every host and port of the plugin."""
+
+        scan_id, scan_name, vulnerability = plugin
+        plugin_id = vulnerability["plugin_id"]
+
+        try:
+            plugin_details = nessus.get_plugin_details(scan_id, plugin_id)
+        except NessusException:
+            logger.error(f"Couldn't fetch plugin '{plugin_id}' of scan '{scan_id}', skipping")
+            return []
+
+        return [
+            {
+                "scan_id": scan_id,
+                "scan_name": scan_name,
+                "host": record.host,
+                "port": record.port,
+                "proto": record.proto,
+                "service": record.service,
+                "plugin_id": plugin_id,
+                "plugin_name": vulnerability["plugin_name"],
+                "plugin_family": vulnerability.get("plugin_family"),
+                "severity": SEVERITIES[vulnerability["severity"]],
+            }
+            for record in iter_plugin_records(plugin_details.get("outputs") or [])
+        ]
+
+    def iter_records(self) -> Iterator[dict]:
+        """Yields the inventory records as the plugin details come in."""
+
+        plugins = (plugin for scan_id in self.scan_ids for plugin in self._get_plugins(scan_id))
+
+        for records in concurrent_map(self._get_records, plugins, self.workers):
+            yield from records
+
+
+def run():
+    logger.info("Collecting the host inventory")
+
+    inventory = HostInventory(args.scan_ids, args.severity, args.plugins, args.workers)
+
+    if args.outfile is None:
+        RecordWriter(args.format, FIELDS).write_all(inventory.iter_records())
+        return
+
+    logger.info(f"Writing inventory to '{args.outfile}'")
+    with args.outfile.open("w", newline="") as fp:
+        RecordWriter(args.format, FIELDS, fp).write_all(inventory.iter_records())
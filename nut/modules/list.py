@@ -1,10 +1,14 @@
 import logging
+import sys
 from textwrap import shorten
+from typing import Iterable, Iterator, Optional
 
 from prettytable import PrettyTable
 
+from nut.output import MACHINE_FORMATS, RecordWriter, render_plain
+from nut.servers import is_fan_out, iter_server_records
 from nut.settings import args
-from nut.utils import nessus
+from nut.utils import REGEX_PREFIX, is_name_pattern, match_names, nessus
 
 logger = logging.getLogger(__name__)
 
@@ -19,50 +23,134 @@ def _fmt_scan(_, value):
     return shorten(value, width=36, placeholder="...")
 
 
-def get_folders_table():
-    """Returns a table containing all available folders."""
+def iter_folders() -> Iterator[dict]:
+    """Yields a record for every available folder."""
 
     logger.info("Listing available folders")
 
-    table = PrettyTable()
-    table.title = "Folders"
+    for folder in nessus.get_folders():
+        yield {"id": folder["id"], "name": folder["name"]}
 
-    table.field_names = ["ID", "Name"]
-    table.custom_format = {"Name": _fmt_folder}
-    table.align["ID"] = "r"
-    table.align["Name"] = "l"
 
-    for folder in nessus.get_folders():
-        table.add_row(
-            [folder["id"], folder["name"]],
-        )
+def _resolve_folder_id(folder: str) -> Optional[int]:
+    """Returns the id of a folder id or name."""
 
-    return table
+    if folder.isdigit():
+        return int(folder)
+
+    return nessus.get_folder_id(folder)
+
+
+def _filter_names(scans: list[dict], selector: str) -> list[dict]:
+    """Returns the scans whose name matches the selector, like '-s' selects them."""
+
+    names = sorted({s["name"] for s in scans})
+
+    matched = {selector}
+    if is_name_pattern(selector, names):
+        matched = set(match_names([selector], names)[selector])
 
+    return [s for s in scans if s["name"] in matched]
 
-def get_scans_table():
-    """Returns a table containing all available folders and scans."""
+
+def iter_scans(
+    folder: Optional[str] = None,
+    name: Optional[str] = None,
+    regex: Optional[str] = None,
+    status: Optional[list[str]] = None,
+    since: Optional[int] = None,
+) -> Iterator[dict]:
+    """
+    Yields a record for every available scan, sorted by folder and name.
+
+    The folder and modification date filters are applied by Nessus, so only
+    the relevant scans are transferred. The name and status filters are
+    applied before anything is sorted or formatted.
+    """
 
     logger.info("Listing available folders and scans")
 
-    # Fetch list of all scans and folders
-    data = nessus.scans_list()
+    folder_id = None
+    if folder is not None:
+        folder_id = _resolve_folder_id(folder)
+        if folder_id is None:
+            logger.error(f"Folder '{folder}' doesn't exist")
+            return
+
+    # Fetch list of the (filtered) scans and all folders
+    data = nessus.scans_list(folder_id=folder_id, last_modification_date=since)
 
     # Maps folder ids to names
     folder_map = {f["id"]: f["name"] for f in data["folders"]}
 
-    # Create 'row' lists with folder and scan data
-    rows = []
-    for scan in data["scans"]:
+    # Nessus returns null instead of an empty list if no scans match
+    scans = data["scans"] or []
+
+    if name is not None:
+        scans = _filter_names(scans, name)
+
+    if regex is not None:
+        scans = _filter_names(scans, f"{REGEX_PREFIX}{regex}")
+
+    if status:
+        scans = [s for s in scans if s["status"] in status]
+
+    # Sort by folder id and scan name
+    scans.sort(key=lambda s: (s["folder_id"], s["name"]))
+
+    for scan in scans:
         folder_id = scan["folder_id"]
-        folder_name = folder_map[folder_id]
 
-        rows.append(
-            [folder_id, folder_name, scan["id"], scan["name"]],
+        yield {
+            "folder_id": folder_id,
+            "folder_name": folder_map[folder_id],
+            "scan_id": scan["id"],
+            "scan_name": scan["name"],
+            "status": scan["status"],
+        }
+
+
+def _scan_filters() -> dict:
+    """Returns the scan filters that were passed on the command line."""
+    return {
+        "folder": args.folder,
+        "name": args.name,
+        "regex": args.regex,
+        "status": args.status,
+        "since": args.since,
+    }
+
+
+def iter_policies() -> Iterator[dict]:
+    """Yields a record for every available policy."""
+
+    logger.info("Listing available policies")
+
+    for policy in nessus.get_policies():
+        yield {"id": policy["id"], "name": policy["name"]}
+
+
+def get_folders_table(folders: Iterable[dict]):
+    """Returns a table containing the folders."""
+
+    table = PrettyTable()
+    table.title = "Folders"
+
+    table.field_names = ["ID", "Name"]
+    table.custom_format = {"Name": _fmt_folder}
+    table.align["ID"] = "r"
+    table.align["Name"] = "l"
+
+    for folder in folders:
+        table.add_row(
+            [folder["id"], folder["name"]],
         )
 
-    # Sort by folder id and scan id
-    rows.sort(key=lambda r: (r[0], r[3]))
+    return table
+
+
+def get_scans_table(scans: Iterable[dict]):
+    """Returns a table containing the folders and scans."""
 
     table = PrettyTable()
     table.title = "Folders and Scans"
@@ -76,31 +164,31 @@ def get_scans_table():
     table.align["Scan"] = "l"
 
     curr_folder = None
-    for i, row in enumerate(rows):
+    for i, scan in enumerate(scans):
         # If the current row has a new folder shows its id and name
-        if row[0] != curr_folder:
-            table.add_row(row)
+        if scan["folder_id"] != curr_folder:
+            table.add_row(
+                [scan["folder_id"], scan["folder_name"], scan["scan_id"], scan["scan_name"]],
+            )
 
             # Add a bottom divider to the previous line to separate folders
             if curr_folder is not None:  # skip for the first folder
                 table._dividers[i - 1] = True
 
             # Update the current folder
-            curr_folder = row[0]
+            curr_folder = scan["folder_id"]
 
         # If the folder is the same hide its id and name
         else:
             table.add_row(
-                ["", "", row[2], row[3]],
+                ["", "", scan["scan_id"], scan["scan_name"]],
             )
 
     return table
 
 
-def get_policies_table():
-    """Returns a table containing all available policies."""
-
-    logger.info("Listing available policies")
+def get_policies_table(policies: Iterable[dict]):
+    """Returns a table containing the policies."""
 
     table = PrettyTable()
     table.title = "Policies"
@@ -109,7 +197,7 @@ def get_policies_table():
     table.align["ID"] = "r"
     table.align["Name"] = "l"
 
-    for policy in nessus.get_policies():
+    for policy in policies:
         table.add_row(
             [policy["id"], policy["name"]],
         )
@@ -118,11 +206,45 @@ def get_policies_table():
 
 
 def run():
+    # Filtering only makes sense for scans, so it implies '--scans'
+    if any(_scan_filters().values()):
+        args.scans = True
+
+    if args.policies:
+        iter_records, fields, ids = iter_policies, ["id", "name"], ["id"]
+    elif args.scans:
+        iter_records = lambda: iter_scans(**_scan_filters())  # noqa: E731
+        fields, ids = ["folder_id", "folder_name", "scan_id", "scan_name", "status"], ["folder_id", "scan_id"]
+    else:
+        iter_records, fields, ids = iter_folders, ["id", "name"], ["id"]
+
+    # The ids of all servers are prefixed with the server they belong to
+    if is_fan_out():
+        records = iter_server_records(lambda _: iter_records(), ids, uses_scans=False)
+
+        # The records of the servers arrive interleaved, the tables group them by server
+        if args.format not in MACHINE_FORMATS:
+            records = sorted(records, key=lambda record: args.servers.index(record[ids[0]].partition(":")[0]))
+    else:
+        records = iter_records()
+
+    if args.format in MACHINE_FORMATS:
+        RecordWriter(args.format, fields).write_all(records)
+        return
+
+    if args.format == "plain":
+        # Right-align the id columns
+        right = {i for i, field in enumerate(fields) if field.endswith("id")}
+        rows = [[record[field] for field in fields] for record in records]
+
+        sys.stdout.write(f"{render_plain(fields, rows, right)}\n")
+        return
+
     if args.policies:
-        table = get_policies_table()
+        table = get_policies_table(records)
     elif args.scans:
-        table = get_scans_table()
+        table = get_scans_table(records)
     else:
-        table = get_folders_table()
+        table = get_folders_table(records)
 
     print(f"\n{table.get_string()}\n")
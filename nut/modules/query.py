@@ -0,0 +1,148 @@
+import logging
+import sqlite3
+import sys
+from typing import Iterator, Optional
+
+from nut.database import connect
+from nut.output import MACHINE_FORMATS, RecordWriter, render_plain
+from nut.settings import SEVERITIES, args
+from nut.utils import resolve_scan_ids
+
+logger = logging.getLogger(__name__)
+
+# Fields of the finding records
+FIELDS = [
+    "scan_id",
+    "scan_name",
+    "host",
+    "port",
+    "proto",
+    "service",
+    "plugin_id",
+    "plugin_name",
+    "severity",
+    "exploit_available",
+]
+
+FINDINGS_SQL = """
+SELECT
+    s.id AS scan_id,
+    s.name AS scan_name,
+    po.host,
+    po.port,
+    po.proto,
+    po.service,
+    p.plugin_id,
+    p.name AS plugin_name,
+    p.severity,
+    p.exploit_available
+FROM ports po
+JOIN plugins p ON p.scan_id = po.scan_id AND p.plugin_id = po.plugin_id
+JOIN scans s ON s.id = po.scan_id
+"""
+
+
+def _in(column: str, values: list) -> tuple[str, list]:
+    return f"{column} IN ({', '.join('?' * len(values))})", list(values)
+
+
+def _where(
+    scan_ids: Optional[list[int]] = None,
+    plugins: Optional[list[int]] = None,
+    hosts: Optional[list[str]] = None,
+    ports: Optional[list[int]] = None,
+    services: Optional[list[str]] = None,
+    severity: Optional[str] = None,
+    exploitable: bool = False,
+) -> tuple[str, list]:
+    """Returns the WHERE clause and its parameters for the filters."""
+
+    conditions = []
+
+    for column, values in (
+        ("s.id", scan_ids),
+        ("p.plugin_id", plugins),
+        ("po.host", hosts),
+        ("po.port", ports),
+        ("po.service", services),
+    ):
+        if values:
+            conditions.append(_in(column, values))
+
+    if severity:
+        conditions.append(("p.severity >= ?", [SEVERITIES.index(severity)]))
+
+    if exploitable:
+        conditions.append(("p.exploit_available = 1", []))
+
+    if not conditions:
+        return "", []
+
+    clause = " AND ".join(condition for condition, _ in conditions)
+    params = [param for _, values in conditions for param in values]
+
+    return f"WHERE {clause}", params
+
+
+def iter_findings(conn: sqlite3.Connection, **filters) -> Iterator[dict]:
+    """Yields every stored host and port of the plugins matching the filters."""
+
+    where, params = _where(**filters)
+    sql = f"{FINDINGS_SQL} {where} ORDER BY p.severity DESC, p.plugin_id, s.id, po.host, po.port"
+
+    logger.debug(f"Running query with {params=}")
+
+    for row in conn.execute(sql, params):
+        record = dict(row)
+        record["severity"] = SEVERITIES[record["severity"]]
+        record["exploit_available"] = bool(record["exploit_available"])
+        yield record
+
+
+def _write(records: Iterator[dict], fields: list[str]):
+    if args.format in MACHINE_FORMATS:
+        RecordWriter(args.format, fields).write_all(records)
+        return
+
+    rows = [[record[field] for field in fields] for record in records]
+
+    # Right-align the numeric columns
+    right = {i for i, field in enumerate(fields) if field.endswith("id") or field == "port"}
+
+    sys.stdout.write(f"{render_plain(fields, rows, right)}\n")
+
+
+def run():
+    conn = connect(args.db, readonly=True)
+
+    # Raw queries are run as they are, the connection is read-only
+    if args.sql:
+        try:
+            cursor = conn.execute(args.sql)
+        except sqlite3.Error as e:
+            logger.error(f"Invalid query: {e}")
+            return
+
+        fields = [column[0] for column in cursor.description or []]
+        _write((dict(row) for row in cursor), fields)
+        return
+
+    # Scans are resolved against the database, not the scanner
+    scan_ids = None
+    if args.scans or args.folders:
+        scan_ids = resolve_scan_ids(args.scans, args.folders, args.status, args.since)
+        if not scan_ids:
+            logger.error("No valid scan ids found, please check your input")
+            return
+
+    findings = iter_findings(
+        conn,
+        scan_ids=scan_ids,
+        plugins=args.plugins,
+        hosts=args.hosts,
+        ports=args.ports,
+        services=args.services,
+        severity=args.severity,
+        exploitable=args.exploitable,
+    )
+    _write(findings, FIELDS)
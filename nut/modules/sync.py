@@ -0,0 +1,63 @@
+import logging
+from typing import Optional
+
+from nessus.exceptions import NessusException
+
+from nut.database import connect, get_modification_date, replace_scan
+from nut.settings import args
+from nut.utils import concurrent_map, nessus
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_plugin(job: tuple) -> tuple:
+    """Returns the vulnerability with the details of its plugin."""
+
+    scan_id, vulnerability = job
+    return vulnerability, nessus.get_plugin_details(scan_id, vulnerability["plugin_id"])
+
+
+def sync_scans(scan_ids: list[int], workers: Optional[int] = None, force: bool = False):
+    """
+    Loads the scans into the local database. Scans that haven't been modified
+    since they were last synced are skipped, unless forced.
+    """
+
+    conn = connect(args.db)
+
+    data = nessus.scans_list()
+    scans = {s["id"]: s for s in data["scans"]}
+    folder_map = {f["id"]: f["name"] for f in data["folders"]}
+
+    synced = 0
+
+    for scan_id in scan_ids:
+        scan = scans[scan_id]
+
+        if not force and get_modification_date(conn, scan_id) == scan["last_modification_date"]:
+            logger.info(f"Scan '{scan_id}' is up to date")
+            continue
+
+        logger.info(f"Syncing scan '{scan_id}'")
+
+        try:
+            details = nessus.get_scan_details(scan_id)
+
+            jobs = [(scan_id, v) for v in details.get("vulnerabilities") or []]
+            plugins = list(concurrent_map(_fetch_plugin, jobs, workers))
+
+        except NessusException as e:
+            logger.error(f"Couldn't fetch scan '{scan_id}', skipping: {e}")
+            continue
+
+        logger.debug(f"Writing {len(plugins)} plugins of scan '{scan_id}'")
+        replace_scan(conn, scan, folder_map.get(scan["folder_id"]), details, plugins)
+        synced += 1
+
+    conn.close()
+
+    logger.info(f"Synced {synced} scans to '{args.db}'")
+
+
+def run():
+    sync_scans(args.scan_ids, args.workers, args.force)
@@ -1,16 +1,28 @@
 import logging
+from pathlib import Path
+from typing import Iterator
 
+from nut import progress
+from nut.output import MACHINE_FORMATS, RecordWriter
+from nut.servers import is_fan_out, iter_server_records
 from nut.settings import args
-from nut.utils import nessus
+from nut.utils import concurrent_map, iter_port_records, nessus
 
 logger = logging.getLogger(__name__)
 
 SERVICE_DETECTION_PLUGIN_ID = 22964
 
+# Fields of the records in machine-readable output
+FIELDS = ["scan_id", "host", "port", "scheme", "url"]
+
 
 def _build_url(proto, host, port):
     """Returns a URL from the supplied parts."""
 
+    # IPv6 addresses have to be enclosed in brackets
+    if ":" in host:
+        host = f"[{host}]"
+
     # if the port is the default for the protocol we can omit it
     if (proto == "http" and port == 80) or (proto == "https" and port == 443):
         return f"{proto}://{host}"
@@ -18,16 +30,28 @@ def _build_url(proto, host, port):
     return f"{proto}://{host}:{port}"
 
 
-def get_urls(scan_ids: list[int]) -> set[str]:
+def _get_service_detection(scan_id: int) -> dict:
+    """Returns the output of the 'Service Detection' plugin of the scan."""
+
+    logger.debug(f"Searching scan '{scan_id}'")
+
+    service_detection = nessus.get_plugin_details(scan_id, SERVICE_DETECTION_PLUGIN_ID)
+    progress.advance("scans")
+
+    return service_detection
+
+
+def iter_urls(scan_ids: list[int]) -> Iterator[dict]:
+    """Yields a record for every web server as soon as it's found."""
+
     logger.info("Searching scans for webservers")
 
-    urls = set()
+    progress.add_total("scans", len(scan_ids))
 
-    for scan_id in scan_ids:
-        logger.debug(f"Searching scan '{scan_id}'")
+    # The scans are fetched concurrently, but kept in order
+    results = concurrent_map(_get_service_detection, scan_ids, args.workers, ordered=True)
 
-        # Get the output of the 'Service Detection' plugin
-        service_detection = nessus.get_plugin_details(scan_id, SERVICE_DETECTION_PLUGIN_ID)
+    for scan_id, service_detection in zip(scan_ids, results):
         if not service_detection:
             logger.error(f"Scan '{scan_id}' has no 'Service Detection', did it run and finish?")
             continue
@@ -51,23 +75,44 @@ def get_urls(scan_ids: list[int]) -> set[str]:
             # And whether it's using http or https
             proto = "https" if "through" in plugin_output else "http"
 
-            for svc, hosts in output["ports"].items():
-                port = int(svc.split(" / ", 1)[0])
-                for host in hosts:
-                    url = _build_url(proto, host["hostname"], port)
-                    logger.debug(f"Found web server '{url}'")
-                    urls.add(url)
+            for record in iter_port_records(output["ports"]):
+                url = _build_url(proto, record.host, record.port)
+                logger.debug(f"Found web server '{url}'")
 
-    return urls
+                yield {"scan_id": scan_id, "host": record.host, "port": record.port, "scheme": proto, "url": url}
+
+
+def get_urls(scan_ids: list[int]) -> set[str]:
+    return {record["url"] for record in iter_urls(scan_ids)}
+
+
+def _iter_records() -> Iterator[dict]:
+    """Yields the records of the selected scans, of all selected servers."""
+
+    if is_fan_out():
+        return iter_server_records(iter_urls)
+
+    return iter_urls(args.scan_ids)
 
 
 def run():
-    urls = get_urls(args.scan_ids)
+    if args.format in MACHINE_FORMATS:
+        # Write to stdout unless a file was explicitly passed
+        if args.outfile is None:
+            RecordWriter(args.format, FIELDS).write_all(_iter_records())
+            return
+
+        logger.info(f"Writing URLs to '{args.outfile}'")
+        with args.outfile.open("w", newline="") as fp:
+            RecordWriter(args.format, FIELDS, fp).write_all(_iter_records())
+        return
+
+    urls = {record["url"] for record in _iter_records()}
     if not urls:
         logger.error("None of the scans detected a webserver")
         return
 
-    outfile = args.outfile
+    outfile = args.outfile or Path("urls.txt")
     logger.info(f"Writing URLs to '{outfile}'")
     with outfile.open("w") as fp:
         fp.write("\n".join(urls))
@@ -0,0 +1,72 @@
+import csv
+import json
+import sys
+from typing import IO, Collection, Iterable, Optional
+
+# Formats that write one record per line, as opposed to the human-readable
+# 'table' output of the modules
+MACHINE_FORMATS = ("jsonl", "csv")
+
+
+class RecordWriter:
+    """
+    Writes records (dicts) as JSON Lines or CSV.
+
+    Records are written as soon as they're passed in, so nothing has to be
+    collected in memory and downstream tools can start consuming right away.
+    """
+
+    def __init__(self, fmt: str, fields: list[str], fp: Optional[IO] = None):
+        if fmt not in MACHINE_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'")
+
+        self.fmt = fmt
+        self.fields = fields
+        self.fp = fp or sys.stdout
+
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self.fp, fieldnames=fields, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, record: dict):
+        if self._csv is None:
+            self.fp.write(json.dumps(record))
+            self.fp.write("\n")
+
+        else:
+            # CSV can't hold nested values, so they're serialized as JSON
+            row = {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in record.items()}
+            self._csv.writerow(row)
+
+        # Records arrive in bursts between API calls, so they're flushed right
+        # away instead of waiting in the buffer for the next burst
+        self.fp.flush()
+
+    def write_all(self, records: Iterable[dict]):
+        for record in records:
+            self.write(record)
+
+
+def render_plain(headers: list[str], rows: list[list], right: Collection[int] = ()) -> str:
+    """
+    Renders the rows as plain, space-separated columns.
+
+    Unlike PrettyTable, the column widths are computed in a single pass and
+    every line is built with one format string, which keeps rendering fast
+    for tens of thousands of rows. Values are never shortened.
+    """
+
+    rows = [[str(value) for value in row] for row in rows]
+
+    widths = [len(header) for header in headers]
+    for row in rows:
+        widths = [max(width, len(value)) for width, value in zip(widths, row)]
+
+    # Right-align the columns in 'right' and left-align the others
+    line = "  ".join(f"{{:{'>' if i in right else '<'}{width}}}" for i, width in enumerate(widths))
+
+    lines = [line.format(*headers).rstrip()]
+    lines.extend(line.format(*row).rstrip() for row in rows)
+
+    return "\n".join(lines)
@@ -0,0 +1,233 @@
+import io
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import IO, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between updates of the status line and between log events
+TTY_INTERVAL = 0.5
+LOG_INTERVAL = 30
+
+
+def _format_bytes(count: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if count < 1024 or unit == "GiB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """
+    Tracks the progress of a long-running module.
+
+    Modules add totals and completed items per unit (e.g. scans and plugins)
+    and every response of the scanner is counted with its size. On a
+    terminal, a status line on stderr is redrawn twice a second, otherwise
+    the same numbers are logged as key=value events every 30 seconds. The
+    ETA is estimated from the first unit.
+    """
+
+    def __init__(self, name: str, units: tuple[str, ...] = ("scans",), stream: Optional[IO] = None):
+        self.name = name
+        self.units = units
+        self.stream = stream or sys.stderr
+        self.is_tty = self.stream.isatty()
+
+        self.totals = dict.fromkeys(units, 0)
+        self.done = dict.fromkeys(units, 0)
+        self.requests = 0
+        self.bytes = 0
+
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+        # Writes to the terminal and redraws of the status line exclude each
+        # other. The line isn't drawn while another line is half-written.
+        self._draw_lock = threading.RLock()
+        self._drawn = False
+        self._line_open = False
+
+    def add_total(self, unit: str, count: int):
+        with self._lock:
+            self.totals[unit] += count
+
+    def advance(self, unit: str, count: int = 1):
+        with self._lock:
+            self.done[unit] += count
+
+    def record_response(self, size: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+
+    def snapshot(self) -> dict:
+        """Returns the current numbers, with the rates per second and the ETA."""
+
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started_at, 1e-9)
+
+            snapshot = {f"{unit}": f"{self.done[unit]}/{self.totals[unit]}" for unit in self.units}
+            snapshot["requests"] = self.requests
+            snapshot["requests_per_s"] = round(self.requests / elapsed, 1)
+            snapshot["bytes"] = self.bytes
+            snapshot["bytes_per_s"] = round(self.bytes / elapsed)
+            snapshot["elapsed_s"] = round(elapsed)
+
+            unit = self.units[0]
+            done, total = self.done[unit], self.totals[unit]
+            snapshot["eta_s"] = round(elapsed / done * (total - done)) if 0 < done <= total else None
+
+        return snapshot
+
+    def _line(self, snapshot: dict) -> str:
+        parts = [f"{unit} {snapshot[unit]}" for unit in self.units]
+        parts.append(f"{snapshot['requests']} req ({snapshot['requests_per_s']}/s)")
+
+        if snapshot["bytes"]:
+            parts.append(f"{_format_bytes(snapshot['bytes'])} ({_format_bytes(snapshot['bytes_per_s'])}/s)")
+
+        if snapshot["eta_s"] is not None:
+            parts.append(f"ETA {_format_duration(snapshot['eta_s'])}")
+
+        return f"[{self.name}] {'  '.join(parts)}"
+
+    def write_above(self, stream: IO, data: str) -> int:
+        """Writes to the terminal above the status line, which is removed first."""
+
+        with self._draw_lock:
+            if self._drawn:
+                self.stream.write("\r\x1b[K")
+                self.stream.flush()
+                self._drawn = False
+
+            count = stream.write(data)
+            self._line_open = not data.endswith("\n")
+
+        return count
+
+    def report(self):
+        snapshot = self.snapshot()
+
+        if self.is_tty:
+            with self._draw_lock:
+                if not self._line_open:
+                    self.stream.write(f"\r\x1b[K{self._line(snapshot)}")
+                    self.stream.flush()
+                    self._drawn = True
+        else:
+            fields = " ".join(f"{key}={value}" for key, value in snapshot.items() if value is not None)
+            logger.info(f"progress module={self.name} {fields}")
+
+    def _run(self):
+        interval = TTY_INTERVAL if self.is_tty else LOG_INTERVAL
+        while not self._stopped.wait(interval):
+            self.report()
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+        # Leave the final numbers on the terminal
+        self.report()
+        if self.is_tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class _TerminalStream(io.TextIOBase):
+    """Stream that writes to the terminal above the status line."""
+
+    def __init__(self, stream: IO, progress: Progress):
+        self.stream = stream
+        self.progress = progress
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return True
+
+    def write(self, data: str) -> int:
+        return self.progress.write_above(self.stream, data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+# The progress of the running module, shared by all of its threads
+_active: Optional[Progress] = None
+
+
+@contextmanager
+def tracking(name: str, units: tuple[str, ...] = ("scans",), enabled: bool = True) -> Iterator[Optional[Progress]]:
+    """Tracks and reports the progress of the module while it runs."""
+
+    global _active
+
+    if not enabled:
+        yield None
+        return
+
+    progress = _active = Progress(name, units)
+
+    # Output and log messages on the same terminal would end up on the status
+    # line, so they're written above it
+    handlers = []
+    stdout = sys.stdout
+    if progress.is_tty:
+        for handler in logging.root.handlers:
+            if isinstance(handler, logging.StreamHandler) and handler.stream.isatty():
+                handlers.append((handler, handler.setStream(_TerminalStream(handler.stream, progress))))
+
+        if sys.stdout.isatty():
+            stdout = _TerminalStream(sys.stdout, progress)
+
+    progress.start()
+    try:
+        with redirect_stdout(stdout):
+            yield progress
+    finally:
+        _active = None
+        progress.stop()
+
+        for handler, stream in handlers:
+            handler.setStream(stream)
+
+
+def add_total(unit: str, count: int):
+    if _active is not None and unit in _active.totals:
+        _active.add_total(unit, count)
+
+
+def advance(unit: str, count: int = 1):
+    if _active is not None and unit in _active.done:
+        _active.advance(unit, count)
+
+
+def count_response(response, *_, **__):
+    """Response hook for the sessions of the clients, counts requests and bytes."""
+
+    if _active is not None:
+        _active.record_response(len(response.content))
@@ -0,0 +1,181 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from nessus.exceptions import NessusException
+
+from nut.client import CachingNessusAPI
+from nut.settings import DEFAULT_SERVER, args, config, get_server_sections
+from nut.utils import create_client, nessus, resolve_scan_ids, scanner
+
+logger = logging.getLogger(__name__)
+
+# Clients of the servers other than the default one, created on first use
+_clients = {}
+_clients_lock = Lock()
+
+# Records of several servers that may wait for the writer at a time
+RECORD_QUEUE_SIZE = 1000
+
+# Put into the record queue once every server is done
+_DONE = object()
+
+
+def get_client(server: str) -> CachingNessusAPI:
+    """Returns the client of the server."""
+
+    if server == DEFAULT_SERVER:
+        return scanner
+
+    with _clients_lock:
+        if server not in _clients:
+            client = create_client(config[get_server_sections()[server]])
+
+            # Use the same caching as the default client, e.g. in 'nut serve'
+            if scanner.cache_enabled:
+                client.enable_cache(scanner.cache_ttl)
+
+            _clients[server] = client
+
+    return _clients[server]
+
+
+def is_fan_out() -> bool:
+    """Checks if the command runs on more than one server."""
+    return len(getattr(args, "servers", None) or []) > 1
+
+
+def namespace(server: str, value) -> str:
+    """Prefixes the (scan or folder) id with the server, e.g. 'zone-a:42'."""
+    return f"{server}:{value}"
+
+
+def _server_selectors(selectors: list[str], server: str) -> list[str]:
+    """
+    Returns the scan or folder selectors that apply to the server. Selectors
+    prefixed with a server name (e.g. 'zone-a:42') only apply to that server,
+    all others apply to every server.
+    """
+
+    servers = get_server_sections()
+
+    result = []
+    for selector in selectors:
+        prefix, sep, rest = selector.partition(":")
+
+        if not sep or prefix not in servers:
+            result.append(selector)
+        elif prefix == server:
+            result.append(rest)
+
+    return result
+
+
+def resolve_server_scan_ids(server: Optional[str] = None) -> list[int]:
+    """Resolves the scans and folders passed on the command line on the server."""
+
+    scans, folders = args.scans, args.folders
+
+    if server is not None:
+        scans, folders = _server_selectors(scans, server), _server_selectors(folders, server)
+
+        # None of the selectors are meant for this server
+        if not (scans or folders):
+            return []
+
+    return resolve_scan_ids(scans, folders, args.status, args.since)
+
+
+def run_on_servers(func: Callable[[str, list[int]], Any], uses_scans: bool = True) -> list[tuple[str, Any]]:
+    """
+    Calls 'func(server, scan_ids)' for every selected server concurrently and
+    returns the results in the order of the servers, so the total time is
+    that of the slowest server. Every call uses the client of its server.
+
+    If the module uses scans, they're resolved on each server first and
+    servers without matching scans are skipped. Servers that fail are
+    skipped as well, so one unreachable server doesn't fail the others.
+    """
+
+    def _run(server: str) -> Optional[tuple]:
+        with nessus.using(get_client(server)):
+            try:
+                scan_ids = []
+
+                if uses_scans:
+                    scan_ids = resolve_server_scan_ids(server)
+                    if not scan_ids:
+                        logger.warning(f"No matching scans on server '{server}'")
+                        return None
+
+                return server, func(server, scan_ids)
+
+            except NessusException as e:
+                logger.error(f"Error from server '{server}', skipping: {e}")
+                return None
+
+    with ThreadPoolExecutor(max_workers=len(args.servers)) as executor:
+        results = executor.map(_run, args.servers)
+
+    return [result for result in results if result is not None]
+
+
+def iter_server_records(
+    func: Callable[[list[int]], Iterable[dict]],
+    fields: Iterable[str] = ("scan_id",),
+    uses_scans: bool = True,
+) -> Iterator[dict]:
+    """
+    Yields the records of 'func(scan_ids)' from every selected server as they
+    come in, with the ids in the fields prefixed with the server.
+
+    The servers put their records into a bounded queue, so they're streamed
+    like the records of a single server and a slow writer makes the servers
+    wait instead of piling up records in memory.
+    """
+
+    records = Queue(maxsize=RECORD_QUEUE_SIZE)
+    stopped = Event()
+    errors = []
+
+    def _put_records(server: str, scan_ids: list[int]):
+        for record in func(scan_ids):
+            # The consumer is gone, e.g. because writing the output failed
+            if stopped.is_set():
+                return
+
+            for field in fields:
+                record[field] = namespace(server, record[field])
+
+            records.put(record)
+
+    def _run():
+        try:
+            run_on_servers(_put_records, uses_scans)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            records.put(_DONE)
+
+    # The servers select their own clients, so the thread doesn't need the caller's context
+    thread = Thread(target=_run, name="servers", daemon=True)
+    thread.start()
+
+    try:
+        while (record := records.get()) is not _DONE:
+            yield record
+
+    finally:
+        stopped.set()
+
+        # Unblock the servers that wait for room in the queue
+        while thread.is_alive():
+            try:
+                records.get(timeout=0.1)
+            except Empty:
+                pass
+
+    if errors:
+        raise errors[0]
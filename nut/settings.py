@@ -8,6 +8,15 @@ LOCATION = Path(__file__).parent.resolve()
 CONFIG_DIR = Path.home() / ".config" / "nut"
 CONFIG_FILE = CONFIG_DIR / "nut.conf"
 
+# Unix socket of 'nut serve', which other nut processes forward commands to
+SOCKET_FILE = CONFIG_DIR / "nut.sock"
+
+# Default location of the database created by 'nut sync'
+DATABASE_FILE = CONFIG_DIR / "nut.db"
+
+# Names of the severities of plugins, indexed by their number in the API
+SEVERITIES = ["info", "low", "medium", "high", "critical"]
+
 CONFIG_DIR.mkdir(parents=True, exist_ok=True)
 if not CONFIG_FILE.exists():
     shutil.copy(LOCATION / "nut.conf", CONFIG_FILE)
@@ -19,3 +28,21 @@ config.read(CONFIG_FILE)
 
 # Stores command line arguments
 args = Namespace()
+
+# Name of the server in the '[nessus]' section, other servers are defined in
+# '[nessus:NAME]' sections
+DEFAULT_SERVER = "default"
+
+
+def get_server_sections() -> dict[str, str]:
+    """Returns the config sections of all configured servers by name."""
+
+    sections = {}
+
+    for section in config.sections():
+        if section == "nessus":
+            sections[DEFAULT_SERVER] = section
+        elif section.startswith("nessus:"):
+            sections[section.partition(":")[2]] = section
+
+    return sections
@@ -1,24 +1,35 @@
 import logging
-from collections import defaultdict
-from ipaddress import ip_address
+import re
+from bisect import bisect_left
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from configparser import SectionProxy
+from contextvars import copy_context
+from functools import lru_cache
+from operator import itemgetter
+from socket import AF_INET, AF_INET6, inet_pton
 from textwrap import shorten
-from typing import Collection, Optional
+from typing import Callable, Collection, Iterable, Iterator, NamedTuple, Optional, Union
 
-from nessus import NessusAPI
 from netaddr import (
+    INET_PTON,
     AddrFormatError,
     IPAddress,
     IPGlob,
     IPNetwork,
+    IPRange,
     IPSet,
     iter_nmap_range,
     valid_glob,
     valid_ipv4,
+    valid_ipv6,
     valid_nmap_range,
 )
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 
+from nut.client import DEFAULT_TIMEOUT, CachingNessusAPI, ClientProxy
+from nut.limiter import MAX_CONCURRENCY
 from nut.settings import config
 
 # Disable warnings for insecure connections
@@ -26,52 +37,314 @@ disable_warnings(InsecureRequestWarning)
 
 logger = logging.getLogger(__name__)
 
+
+def create_client(section: SectionProxy) -> CachingNessusAPI:
+    """Creates a NessusAPI instance for the server in the config section."""
+
+    return CachingNessusAPI(
+        section["url"],
+        access_key=section.get("access_key"),
+        secret_key=section.get("secret_key"),
+        username=section.get("username"),
+        password=section.get("password"),
+        timeout=section.getfloat("timeout", DEFAULT_TIMEOUT),
+    )
+
+
 # Create a central NessusAPI instance
-nessus = NessusAPI(
-    config["nessus"]["url"],
-    access_key=config["nessus"]["access_key"],
-    secret_key=config["nessus"]["secret_key"],
-    username=config["nessus"]["username"],
-    password=config["nessus"]["password"],
-)
+scanner = create_client(config["nessus"])
+
+# What the modules use, which is the scanner unless another data source is
+# selected
+nessus = ClientProxy(scanner)
+
 
+# Scan and folder selectors with one of these characters are glob patterns,
+# selectors with the prefix are regexes
+_GLOB_CHARS = "*?["
+REGEX_PREFIX = "re:"
 
-def resolve_scan_ids(scans: list[str], folders: list[str]) -> list[int]:
+# Patterns that can't be looked up by a literal prefix or suffix are matched
+# in combined alternations, each split into this many smaller ones
+_COMBINED_GROUPS = 16
+
+# Backreferences and conditionals, which refer to groups by number
+_GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def is_name_pattern(selector: str, names: Collection[str] = ()) -> bool:
     """
-    Resolves lists of scan and folder ids or names into a list of unique scan ids.
+    Checks if a scan or folder selector is a glob or regex pattern. Exact
+    names come first, so a selector that's one of the names (e.g. a scan
+    named 'Internal [DMZ]') is never a pattern.
     """
 
-    # Fetch list of all scans and folders
-    data = nessus.scans_list()
+    if selector in names:
+        return False
+
+    return selector.startswith(REGEX_PREFIX) or any(c in selector for c in _GLOB_CHARS)
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """
+    Translates a glob into a regex. Unlike 'fnmatch.translate()', the regex
+    contains no groups and no anchors, so several of them can be combined.
+    """
+
+    parts = []
+    i, n = 0, len(pattern)
+
+    while i < n:
+        c = pattern[i]
+        i += 1
+
+        if c == "*":
+            parts.append(".*")
+
+        elif c == "?":
+            parts.append(".")
+
+        elif c == "[":
+            # Find the end of the character class, a leading ']' is part of it
+            j = i + 1 if pattern[i : i + 1] == "!" else i
+            j = pattern.find("]", j + 1 if pattern[j : j + 1] == "]" else j)
+
+            # An unclosed bracket is matched literally
+            if j == -1:
+                parts.append(re.escape(c))
+                continue
+
+            chars = pattern[i:j].replace("\\", "\\\\")
+            if chars.startswith("!"):
+                chars = f"^{chars[1:]}"
+            elif chars.startswith("^"):
+                chars = f"\\{chars}"
+
+            parts.append(f"[{chars}]")
+            i = j + 1
+
+        else:
+            parts.append(re.escape(c))
+
+    return "".join(parts)
+
+
+def _literal_prefix(pattern: str) -> str:
+    """Returns the part of the glob before the first wildcard."""
+
+    for i, c in enumerate(pattern):
+        if c in _GLOB_CHARS:
+            return pattern[:i]
+
+    return pattern
+
+
+def _literal_suffix(pattern: str) -> str:
+    """Returns the part of the glob after the last wildcard."""
+
+    # ']' closes a character class, which is a wildcard as well
+    for i in range(len(pattern) - 1, -1, -1):
+        if pattern[i] in "*?[]":
+            return pattern[i + 1 :]
+
+    return pattern
+
+
+def _prefix_range(names: list[str], prefix: str) -> range:
+    """Returns the range of indexes of the sorted names that start with the prefix."""
+
+    if not prefix:
+        return range(len(names))
+
+    # All names with the prefix sort before the prefix with its last character
+    # incremented (e.g. 'abc' < 'abc...' < 'abd')
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    return range(bisect_left(names, prefix), bisect_left(names, upper))
+
+
+def _search_regex(pattern: str) -> re.Pattern:
+    """
+    Translates a glob into a regex for 'search()'. Leading and trailing '*'
+    are dropped instead of anchoring the regex, so '*-42-*' is just '-42-'.
+    """
+
+    regex = _glob_to_regex(pattern.strip("*"))
+
+    if not pattern.startswith("*"):
+        regex = f"\\A{regex}"
+    if not pattern.endswith("*"):
+        regex = f"{regex}\\Z"
+
+    return re.compile(regex, re.DOTALL)
+
+
+def _match_combined(
+    regexes: list[tuple[str, re.Pattern]], names: list[str], matches: dict[str, list[str]], flags: int = 0
+):
+    """
+    Matches the regexes against the names, several at once. The regexes are
+    combined into one alternation, and only the names that match it are
+    matched against up to 16 smaller alternations of them, and so on. So
+    a name is only tested on its own against the few regexes of a group
+    it matched, not against every regex. The regexes have to share the flags.
+    """
+
+    if len(regexes) > 1:
+        try:
+            combined = re.compile("|".join(f"(?:{regex.pattern})" for _, regex in regexes), flags)
+        except re.error:
+            # e.g. named groups with the same name, the smaller groups can still be combined
+            combined = None
+
+        if combined is not None:
+            names = [name for name in names if combined.search(name)]
+
+        size = -(-len(regexes) // _COMBINED_GROUPS)
+        for i in range(0, len(regexes), size):
+            _match_combined(regexes[i : i + size], names, matches, flags)
+        return
+
+    for pattern, regex in regexes:
+        matches[pattern] = [name for name in names if regex.search(name)]
+
+
+def match_names(patterns: Collection[str], names: list[str]) -> dict[str, list[str]]:
+    """
+    Matches glob and regex patterns against a sorted list of names and returns
+    the names each pattern matched. Globs have to match the whole name,
+    regexes (with the 're:' prefix) anywhere in it.
+
+    Globs are only tested against the names that share their literal prefix
+    or suffix, whichever narrows them down more. Both are looked up by
+    bisecting the sorted names and the sorted reversed names respectively.
+    Globs without either and regexes are combined (see '_match_combined()'),
+    so the names are scanned once for all of them instead of once per pattern.
+    """
+
+    matches = {}
+
+    # Globs that can't be looked up and regexes, by pattern
+    globs = {}
+    regexes = {}
+    separate = {}
+
+    # Reversed names for the suffix lookups, only built if needed
+    reversed_names = None
+
+    # Every pattern only once, in order
+    for pattern in dict.fromkeys(patterns):
+        if pattern.startswith(REGEX_PREFIX):
+            regex = re.compile(pattern[len(REGEX_PREFIX) :])
+
+            # Global flags and references to groups by number change the
+            # meaning of the other regexes once combined
+            if regex.flags & ~re.UNICODE or _GROUP_REFERENCE.search(regex.pattern):
+                separate[pattern] = regex
+            else:
+                regexes[pattern] = regex
+            continue
+
+        prefix = _literal_prefix(pattern)
+        suffix = _literal_suffix(pattern)
+
+        if not prefix and not suffix:
+            globs[pattern] = _search_regex(pattern)
+            continue
+
+        candidates = _prefix_range(names, prefix)
+
+        if suffix:
+            if reversed_names is None:
+                reversed_names = sorted(name[::-1] for name in names)
+
+            suffix_candidates = _prefix_range(reversed_names, suffix[::-1])
+
+        if suffix and len(suffix_candidates) < len(candidates):
+            candidates = (reversed_names[i][::-1] for i in suffix_candidates)
+            candidates = (name for name in candidates if name.startswith(prefix))
+        else:
+            candidates = (names[i] for i in candidates)
+            candidates = (name for name in candidates if name.endswith(suffix))
+
+        # The literal parts are checked first, they're a lot cheaper
+        regex = re.compile(_glob_to_regex(pattern), re.DOTALL)
+        matches[pattern] = sorted(name for name in candidates if regex.fullmatch(name))
+
+    _match_combined(list(globs.items()), names, matches, re.DOTALL)
+    _match_combined(list(regexes.items()), names, matches)
 
-    # Maps folder names to ids
-    folder_map = {f["name"]: f["id"] for f in data["folders"]}
+    for pattern, regex in separate.items():
+        matches[pattern] = [name for name in names if regex.search(name)]
 
-    # Set of all valid scan ids
-    valid_scan_ids = set()
+    # In the order of the patterns
+    return {pattern: matches[pattern] for pattern in dict.fromkeys(patterns)}
 
-    # Maps scan names to id(s)
-    scan_map = defaultdict(set)
 
-    # Maps folder ids to scan ids it contains
-    folder_scans_map = defaultdict(set)
+class ScanIndex:
+    """Index of the scans and folders of a single 'scans_list()' response."""
 
-    for scan in data["scans"]:
-        scan_id = scan["id"]
-        valid_scan_ids.add(scan_id)
+    def __init__(self, data: dict):
+        # Maps scan ids to scans
+        self.scans = {}
 
-        scan_name = scan["name"]
-        scan_map[scan_name].add(scan_id)
+        # Maps folder names to ids
+        self.folder_map = {f["name"]: f["id"] for f in data["folders"]}
 
-        folder_id = scan["folder_id"]
-        folder_scans_map[folder_id].add(scan_id)
+        # Maps scan names to id(s)
+        self.scan_map = defaultdict(set)
+
+        # Maps folder ids to scan ids it contains
+        self.folder_scans_map = defaultdict(set)
+
+        # Nessus returns null instead of an empty list if there are no scans
+        for scan in data["scans"] or []:
+            scan_id = scan["id"]
+            self.scans[scan_id] = scan
+            self.scan_map[scan["name"]].add(scan_id)
+            self.folder_scans_map[scan["folder_id"]].add(scan_id)
+
+        # Sorted names for pattern matching
+        self.scan_names = sorted(self.scan_map)
+        self.folder_names = sorted(self.folder_map)
+
+
+def resolve_scan_ids(
+    scans: list[str],
+    folders: list[str],
+    status: Optional[Collection[str]] = None,
+    since: Optional[int] = None,
+) -> list[int]:
+    """
+    Resolves lists of scan and folder ids, names, or patterns into a list of
+    unique scan ids, optionally filtered by status and modification date.
+
+    Patterns are globs (e.g. '2026-10-*-External') or regexes with the 're:'
+    prefix. Unlike names, they may match several scans. Selectors that are
+    exact names are never treated as patterns.
+    """
+
+    # Fetch list of all scans and folders
+    index = ScanIndex(nessus.scans_list())
 
     # Set to collect all scan ids
     scan_ids = set()
 
+    folder_patterns = [f for f in folders if is_name_pattern(f, index.folder_map)]
+    for pattern, names in match_names(folder_patterns, index.folder_names).items():
+        if not names:
+            logger.error(f"Folder pattern '{pattern}' didn't match any folders")
+            continue
+
+        for name in names:
+            scan_ids.update(index.folder_scans_map[index.folder_map[name]])
+
     for folder in folders:
+        if is_name_pattern(folder, index.folder_map):
+            continue
+
         # It's either the folder id (cast to int) or name (resolve id)
-        folder_id = int(folder) if folder.isdigit() else folder_map.get(folder)
+        folder_id = int(folder) if folder.isdigit() else index.folder_map.get(folder)
 
         # Check if the folder name could be resolved
         if folder_id is None:
@@ -79,20 +352,33 @@ def resolve_scan_ids(scans: list[str], folders: list[str]) -> list[int]:
             continue
 
         # Check if the folder exists/contains scans
-        folder_scans = folder_scans_map[folder_id]
+        folder_scans = index.folder_scans_map[folder_id]
         if not folder_scans:
             logger.error(f"Folder '{folder}' doesn't exist or is empty")
             continue
 
         scan_ids.update(folder_scans)
 
+    scan_patterns = [s for s in scans if is_name_pattern(s, index.scan_map)]
+    for pattern, names in match_names(scan_patterns, index.scan_names).items():
+        if not names:
+            _pattern = shorten(pattern, width=48, placeholder="...")
+            logger.error(f"Scan pattern '{_pattern}' didn't match any scans")
+            continue
+
+        for name in names:
+            scan_ids.update(index.scan_map[name])
+
     for scan in scans:
+        if is_name_pattern(scan, index.scan_map):
+            continue
+
         # If it's a scan id just check if it's valid and add it
         if scan.isdigit():
             scan_id = int(scan)
 
             # Check if the scan id is valid
-            if scan_id not in valid_scan_ids:
+            if scan_id not in index.scans:
                 logger.error(f"Scan '{scan}' doesn't exist")
                 continue
 
@@ -104,7 +390,7 @@ def resolve_scan_ids(scans: list[str], folders: list[str]) -> list[int]:
             # Truncate the scan name for log messages, so they're not too long
             _name = shorten(scan, width=48, placeholder="...")
 
-            possible_ids = scan_map.get(scan)
+            possible_ids = index.scan_map.get(scan)
 
             # Check if the scan name could be resolved
             if possible_ids is None:
@@ -118,6 +404,13 @@ def resolve_scan_ids(scans: list[str], folders: list[str]) -> list[int]:
 
             scan_ids.update(possible_ids)
 
+    # Apply the filters to everything that was selected
+    if status:
+        scan_ids = {i for i in scan_ids if index.scans[i]["status"] in status}
+
+    if since is not None:
+        scan_ids = {i for i in scan_ids if index.scans[i]["last_modification_date"] >= since}
+
     scan_ids = list(scan_ids)
 
     logger.info(f"Scan IDs: {scan_ids}")
@@ -125,20 +418,108 @@ def resolve_scan_ids(scans: list[str], folders: list[str]) -> list[int]:
     return scan_ids
 
 
+def concurrent_map(func: Callable, items: Iterable, workers: Optional[int] = None, ordered: bool = False) -> Iterator:
+    """
+    Calls the function for every item in a pool of worker threads and yields
+    the results as they complete, or in the order of the items if 'ordered'.
+    At most twice as many items as there are workers are submitted at a time,
+    so the items can be a lazy iterable and pending results don't pile up in
+    memory.
+
+    Without a number of workers, there are as many as the client's limiter
+    allows at most, and the limiter decides how many of them send requests
+    at the same time.
+
+    The calls run in copies of the caller's context, so they use the same
+    client as the caller (see 'ClientProxy.using()').
+    """
+
+    workers = workers or MAX_CONCURRENCY
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            queue = deque()
+
+            for item in items:
+                if len(queue) >= workers * 2:
+                    yield queue.popleft().result()
+
+                queue.append(executor.submit(copy_context().run, func, item))
+
+            while queue:
+                yield queue.popleft().result()
+
+            return
+
+        pending = set()
+
+        for item in items:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+            pending.add(executor.submit(copy_context().run, func, item))
+
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def _host_range(network: IPNetwork) -> IPRange:
+    """
+    Returns the range of host addresses of the network without enumerating
+    them, following the same rules as 'IPNetwork.iter_hosts()'.
+    """
+
+    # /31, /32, /127, and /128 networks don't reserve any addresses
+    if network.size < 4:
+        return IPRange(network.first, network.last)
+
+    # IPv4 reserves the network and broadcast address, IPv6 only the first
+    # address (Subnet-Router anycast)
+    last = network.last - 1 if network.version == 4 else network.last
+
+    return IPRange(network.first + 1, last)
+
+
+def _normalize_hostname(hostname: str) -> str:
+    """Normalizes a hostname, so different spellings compare equal."""
+    return hostname.lower().rstrip(".")
+
+
+def _valid_range(first: str, last: str) -> bool:
+    """Checks if both addresses are valid and of the same family."""
+
+    # INET_PTON is needed, otherwise '10.0.0.1-5' would be parsed as the range
+    # 10.0.0.1-0.0.0.5 instead of being left to the nmap range check
+    if valid_ipv4(first, INET_PTON) and valid_ipv4(last, INET_PTON):
+        return IPAddress(first) <= IPAddress(last)
+
+    if valid_ipv6(first) and valid_ipv6(last):
+        return IPAddress(first) <= IPAddress(last)
+
+    return False
+
+
 def _split_targets(targets: list) -> tuple[IPSet, set[str]]:
     """
     Splits targets into IPs and hostnames.
+
+    IP networks and ranges are added to the set as ranges, so large networks
+    (especially IPv6 prefixes) are never enumerated address by address.
     """
 
     ips, hosts = IPSet(), set()
 
     for target in targets:
+        target = target.strip()
+
         # NOTE: The order of the checks is important. Unfortunately, there's no
         #   'valid_cidr()' function, so we can't use continuous if/elif/else
         #   statements and have to use 'continue' and 'try/except'.
 
         # Check if the target is a single IP address
-        if valid_ipv4(target):
+        if valid_ipv4(target) or valid_ipv6(target):
             ips.add(IPAddress(target))
 
             # Every address is also a valid CIDR network, so explicitly skip
@@ -149,10 +530,7 @@ def _split_targets(targets: list) -> tuple[IPSet, set[str]]:
         #   checks, because they do not recognize the network and broadcast
         #   addresses!
         try:
-            network = IPNetwork(target)
-
-            for ip in network.iter_hosts():
-                ips.add(ip)
+            ips.add(_host_range(IPNetwork(target)))
 
             # Every network is also a valid nmap/glob range, so explicitly skip
             continue
@@ -160,26 +538,51 @@ def _split_targets(targets: list) -> tuple[IPSet, set[str]]:
         except AddrFormatError:
             pass
 
+        # Check if the target is a range of two addresses (first-last), which
+        # is the only range notation that works for IPv6
+        first, sep, last = target.partition("-")
+        if sep and _valid_range(first, last):
+            ips.add(IPRange(first, last))
+
         # Check if the target is a valid nmap range
-        if valid_nmap_range(target):
+        elif valid_nmap_range(target):
             for ip in iter_nmap_range(target):
                 ips.add(ip)
 
         # Check if the target is a valid glob notation
         elif valid_glob(target):
-            for ip in IPGlob(target):
-                ips.add(ip)
+            ips.add(IPGlob(target))
 
         # All other targets are presumably hostnames
         else:
-            hosts.add(target)
+            hosts.add(_normalize_hostname(target))
 
     return ips, hosts
 
 
+def _format_range(iprange: IPRange) -> str:
+    """Returns the shortest notation of the range."""
+
+    # To avoid ranges like 192.168.0.1-192.168.0.1, only use the first (and
+    # only) address if the range has a size of 1
+    if iprange.first == iprange.last:
+        return str(iprange[0])
+
+    # IPv6 ranges are often whole prefixes, which are shorter in CIDR notation
+    if iprange.version == 6:
+        cidrs = iprange.cidrs()
+        if len(cidrs) == 1:
+            return str(cidrs[0])
+
+    return str(iprange)
+
+
 def resolve_targets(targets: list, exclusions: Optional[list] = None) -> list[str]:
     """
     Filters a list of IPs and hostnames and returns a condensed list of targets.
+
+    Supports IPv4 and IPv6 addresses, networks, and ranges. Hostnames are
+    compared case-insensitively and without a trailing dot.
     """
 
     target_ips, target_hosts = _split_targets(targets)
@@ -190,16 +593,7 @@ def resolve_targets(targets: list, exclusions: Optional[list] = None) -> list[st
         target_ips -= exclude_ips
         target_hosts -= exclude_hosts
 
-    target_defs = []
-
-    for iprange in target_ips.iter_ipranges():
-        # To avoid ranges like 192.168.0.1-192.168.0.1, check the length of the
-        # range and if it's 1, only add the first (and only) item
-        if len(iprange) == 1:
-            target_defs.append(str(iprange[0]))
-
-        else:
-            target_defs.append(str(iprange))
+    target_defs = [_format_range(iprange) for iprange in target_ips.iter_ipranges()]
 
     # Sort the list of hosts and append them to the target definitions
     target_defs.extend(sorted(target_hosts))
@@ -225,7 +619,170 @@ def uniqify(seq):
     return result
 
 
-def sort_hosts(hostlist: Collection[str], unique: bool = True) -> list[str]:
+# Sort order of the known protocols, targets with other protocols are sorted
+# after the IP addresses together with the hostnames
+_PROTOCOLS = {"": 0, "icmp": 1, "sctp": 2, "tcp": 3, "udp": 4}
+
+
+def _split_host(target: str) -> tuple[str, int, str]:
+    """Splits a target into its host, port, and protocol."""
+
+    # IPv6 addresses with a port have to be enclosed in brackets
+    if target.startswith("["):
+        host, _, port = target[1:].partition("]")
+        port = port[1:]
+
+    # A bare IPv6 address, which can't carry a port
+    elif target.count(":") > 1:
+        return target, 0, ""
+
+    else:
+        host, _, port = target.partition(":")
+
+    if not port:
+        return host, 0, ""
+
+    port, _, proto = port.partition("/")
+    return host, int(port), proto
+
+
+def join_host(host: str, port: int, proto: str) -> str:
+    """The inverse of '_split_host()', a port of 0 is omitted."""
+
+    if not port:
+        return host
+
+    if ":" in host:
+        host = f"[{host}]"
+
+    if proto:
+        return f"{host}:{port}/{proto}"
+
+    return f"{host}:{port}"
+
+
+def _pack_address(host: str) -> Optional[int]:
+    """
+    Packs an IP address and its family into a single integer, IPv4 addresses
+    are always smaller than IPv6 ones. Returns None for hostnames.
+    """
+
+    family, af = (1, AF_INET6) if ":" in host else (0, AF_INET)
+
+    try:
+        return family << 128 | int.from_bytes(inet_pton(af, host), "big")
+    except OSError:
+        return None
+
+
+class HostSorter:
+    """
+    Collects hostnames and/or IP addresses and returns them sorted.
+
+    Every target is parsed once when it's added and stored with its sort key,
+    so duplicates are dropped right away instead of in a second pass. IP
+    addresses get a packed integer key that holds the address family, the
+    address, the port, and the protocol. Everything else gets a tuple key and
+    is sorted after the IP addresses. Iterating over the sorter yields the
+    targets in sorted order.
+    """
+
+    def __init__(self, unique: bool = True):
+        self.unique = unique
+
+        # Caches the packed address of each host, since the same host usually
+        # shows up with many different ports
+        self._addresses = {}
+
+        # IP addresses (int keys) and hostnames (tuple keys) can't be compared
+        # with each other, so they're kept apart and sorted separately
+        if unique:
+            self._ips = {}
+            self._names = {}
+        else:
+            self._ips = []
+            self._names = []
+
+    def __len__(self):
+        return len(self._ips) + len(self._names)
+
+    def _insert(self, host: str, port: int, proto: str, target: Union[str, tuple, None] = None):
+        """
+        Adds a parsed target. Targets that were added from their parts are
+        stored as (host, port, proto) tuples and only joined when they're
+        iterated over.
+        """
+
+        key = None
+        proto_id = _PROTOCOLS.get(proto)
+
+        if proto_id is not None and 0 <= port <= 0xFFFF:
+            try:
+                address = self._addresses[host]
+            except KeyError:
+                address = self._addresses[host] = _pack_address(host)
+
+            if address is not None:
+                key = (address << 16 | port) << 3 | proto_id
+
+        if key is None:
+            key = host, port, proto
+            bucket = self._names
+        else:
+            bucket = self._ips
+
+        if self.unique and key in bucket:
+            return
+
+        if target is None:
+            target = host, port, proto
+
+        if self.unique:
+            bucket[key] = target
+        else:
+            bucket.append((key, target))
+
+    def add(self, target: str):
+        self._insert(*_split_host(target), target)
+
+    def add_parts(self, host: str, port: int = 0, proto: str = ""):
+        """Adds a target from its parts without building and parsing a string."""
+        self._insert(host, port, proto)
+
+    def update(self, targets: Iterable[str]):
+        for target in targets:
+            self._insert(*_split_host(target), target)
+
+    def _iter_sorted(self) -> Iterator[Union[str, tuple]]:
+        for bucket in (self._ips, self._names):
+            items = bucket.items() if self.unique else bucket
+            for _, target in sorted(items, key=itemgetter(0)):
+                yield target
+
+    def __iter__(self) -> Iterator[str]:
+        for target in self._iter_sorted():
+            yield target if isinstance(target, str) else join_host(*target)
+
+    def iter_parts(self) -> Iterator[tuple[str, int, str]]:
+        """Yields the host, port, and protocol of the targets in sorted order."""
+
+        for target in self._iter_sorted():
+            yield _split_host(target) if isinstance(target, str) else target
+
+
+def iter_hosts(hostlist: Iterable[str], unique: bool = True) -> Iterator[str]:
+    """
+    Yields the hostnames and/or IP addresses in sorted order.
+
+    See 'sort_hosts()' for the accepted formats.
+    """
+
+    sorter = HostSorter(unique)
+    sorter.update(hostlist)
+    yield from sorter
+
+
+def sort_hosts(hostlist: Iterable[str], unique: bool = True) -> list[str]:
     """
     Sorts a list of hostnames and/or IP addresses.
 
@@ -234,34 +791,53 @@ def sort_hosts(hostlist: Collection[str], unique: bool = True) -> list[str]:
       - 10.0.0.1:22
       - 10.0.0.1:22/tcp
       - 10.0.0.1:53/udp
+      - 2001:db8::1
+      - [2001:db8::1]:22/tcp
       - example.com
       - example.com:80
       - example.com:80/tcp
     """
 
-    def _sort(target):
-        # Returns a tuple (type, host, port) that is used for sorting
+    return list(iter_hosts(hostlist, unique))
 
-        # Split target into host and port
-        host, _, port = target.partition(":")
 
-        if port:
-            port, _, proto = port.partition("/")
-            port = int(port)
-        else:
-            port, proto = 0, ""
+class PortRecord(NamedTuple):
+    """A host and the port it was reported on by a plugin."""
 
-        # Try to parse the host portion as an IP address
-        try:
-            ip = ip_address(host)
-            return 0, int(ip), port, proto
+    host: str
+    port: int
+    proto: str
+    service: str
 
-        # If it fails it is a domain/hostname
-        except ValueError:
-            return 2, host, port, proto
 
-    result = sorted(hostlist, key=_sort)
-    if unique:
-        result = uniqify(result)
+@lru_cache(maxsize=None)
+def parse_port_key(key: str) -> tuple[int, str, str]:
+    """
+    Parses a key of the 'ports' mapping of a plugin output into its port,
+    protocol, and service. Nessus groups hosts by these keys, which look like
+    this: 80 / tcp / www
 
-    return result
+    There are only as many distinct keys as there are distinct services, so
+    the results are cached.
+    """
+
+    port, _, rest = key.partition(" / ")
+    proto, _, service = rest.partition(" / ")
+    return int(port), proto, service
+
+
+def iter_port_records(ports: dict) -> Iterator[PortRecord]:
+    """Yields a record for every host in the 'ports' mapping of a plugin output."""
+
+    for key, hosts in ports.items():
+        port, proto, service = parse_port_key(key)
+
+        for host in hosts:
+            yield PortRecord(host["hostname"], port, proto, service)
+
+
+def iter_plugin_records(plugin_outputs: list[dict]) -> Iterator[PortRecord]:
+    """Yields a record for every host in all outputs of a plugin."""
+
+    for output in plugin_outputs:
+        yield from iter_port_records(output["ports"])